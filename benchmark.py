@@ -0,0 +1,540 @@
+# benchmark.py
+# Benchmarks navidrome_api against a local fake Subsonic server so timings are
+# reproducible without a real Navidrome instance.
+import argparse
+import cProfile
+import gc
+import json
+import os
+import pstats
+import random
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import requests
+import navidrome_api
+
+WORDS = ("love night heart fire dream light rain summer blue river road home city star dance time gold shadow wild moon "
+         "ghost song sky ocean black white electric silent broken highway angel thunder sweet paper glass winter storm "
+         "velvet echo neon lonely morning garden mirror desert violet crystal golden falling runaway hollow signal").split()
+
+def make_library(album_count, songs_per_album, seed=1, live_ratio=0.0):
+    rng = random.Random(seed)
+    words = lambda n: ' '.join(rng.choice(WORDS) for _ in range(n)).title()
+    artists = [words(2) for _ in range(max(1, album_count // 3))]
+    albums = []
+    for a in range(album_count):
+        artist = artists[a % len(artists)]
+        album_name = f"{words(rng.randint(1, 3))} {a}"
+        album_id = f"al-{a}"
+        songs = []
+        for t in range(songs_per_album):
+            title = words(rng.randint(1, 4))
+            songs.append({'id': f"so-{a}-{t}", 'parent': album_id, 'albumId': album_id, 'title': title, 'album': album_name, 'artist': artist,
+                          'track': t + 1, 'duration': rng.randint(120, 420), 'suffix': 'flac', 'contentType': 'audio/flac',
+                          'bitRate': 900, 'size': 30000000, 'coverArt': album_id, 'created': '2024-01-01T00:00:00Z',
+                          'path': f"{artist}/{album_name}/{t + 1:02d} - {title}.flac"})
+        albums.append({'id': album_id, 'name': album_name, 'artist': artist, 'songCount': len(songs), 'song': songs,
+                       'created': '2024-01-01T00:00:00Z'})
+    # Live versions: same artist and titles, different lengths - the near-duplicates text scoring mixes up.
+    live_rng = random.Random(seed + 1000)
+    for album in live_rng.sample(albums, int(len(albums) * live_ratio)):
+        album_id = f"{album['id']}-live"
+        songs = [dict(song, id=f"{song['id']}-live", parent=album_id, albumId=album_id, album=f"{album['name']} Live",
+                      duration=song['duration'] + live_rng.randint(30, 90), path=song['path'].replace(f"/{album['name']}/", f"/{album['name']} Live/"))
+                 for song in album['song']]
+        albums.append(dict(album, id=album_id, name=f"{album['name']} Live", song=songs))
+    return albums
+
+def make_broken_playlist(albums, track_count, miss_ratio, seed=2):
+    # Returns parsed M3U tracks plus the song id each one should resolve to; a share of them
+    # gets the kinds of damage seen in real exports (re-encoded, moved, renamed, typos).
+    rng = random.Random(seed)
+    songs = [song for album in albums for song in album['song']]
+    tracks, expected = [], []
+    for song in rng.sample(songs, min(track_count, len(songs))):
+        path = song['path']
+        if rng.random() < miss_ratio:
+            artist, album_name, filename = path.split('/')
+            title = song['title']
+            damage = rng.choice(['extension', 'moved', 'case', 'retitle', 'typo'])
+            if damage == 'extension': filename = filename.replace('.flac', '.mp3')
+            elif damage == 'moved': artist = f"D:\\Old Library\\Music\\{artist}"
+            elif damage == 'case': artist, album_name = artist.upper(), album_name.lower()
+            elif damage == 'retitle': filename = f"{title} (Remastered).flac"
+            else: filename = f"{title[:-1]}.flac" if len(title) > 4 else f"{title}x.flac"
+            path = f"{artist}/{album_name}/{filename}"
+        tracks.append(f"#EXTINF:{song['duration']},{song['artist']} - {song['title']}\n{path}")
+        expected.append(song['id'])
+    playlist_path = os.path.join(tempfile.mkdtemp(), 'bench.m3u')
+    with open(playlist_path, 'w', encoding='utf-8') as f: f.write("#EXTM3U\n" + "\n".join(tracks) + "\n")
+    return navidrome_api.parse_m3u(playlist_path, extended=True), expected
+
+def write_playlist(folder, name, songs):
+    path = os.path.join(folder, f"{name}.m3u")
+    lines = [f"#EXTINF:{song['duration']},{song['artist']} - {song['title']}\n{song['path']}" if song.get('duration') else song['path'] for song in songs]
+    with open(path, 'w', encoding='utf-8') as f: f.write("#EXTM3U\n" + "\n".join(lines) + "\n")
+    return path
+
+class FakeSubsonicServer:
+    def __init__(self, albums, latency=0.0, form_post=False, empty_search=True, capacity=None):
+        self.albums = albums
+        self.albums_by_id = {album['id']: album for album in albums}
+        self.songs_by_id = {song['id']: song for album in albums for song in album['song']}
+        self.latency = latency
+        self.form_post = form_post
+        self.empty_search = empty_search
+        self.longest_url = 0
+        self.failing_albums = {}  # album id -> how many more getAlbum calls fail
+        self.playlists = []
+        self.last_modified = int(time.time() * 1000)
+        self.request_count = 0
+        # With a capacity, only that many requests are worked on at once and the rest queue, like a small NAS.
+        self.capacity = threading.Semaphore(capacity) if capacity else None
+        self.in_flight = self.peak_in_flight = 0
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._httpd.server_address[1]}"
+
+    def config(self, **overrides):
+        config = {'navidrome_url': self.url, 'navidrome_user': 'bench', 'navidrome_password': 'bench'}
+        config.update(overrides)
+        return config
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def handle(self, endpoint, params):
+        arg = lambda name, default=None: params.get(name, [default])[0]
+        if endpoint == 'ping':
+            return {}
+        if endpoint == 'getOpenSubsonicExtensions':
+            return {'openSubsonicExtensions': [{'name': 'formPost', 'versions': [1]}] if self.form_post else []}
+        if endpoint == 'getIndexes':
+            return {'indexes': {'lastModified': self.last_modified, 'ignoredArticles': ''}}
+        if endpoint == 'getAlbumList2':
+            size, offset = int(arg('size', 10)), int(arg('offset', 0))
+            page = [{k: v for k, v in album.items() if k != 'song'} for album in self.albums[offset:offset + size]]
+            return {'albumList2': {'album': page}}
+        if endpoint == 'getAlbum':
+            with self._lock:
+                if self.failing_albums.get(arg('id')):
+                    self.failing_albums[arg('id')] -= 1
+                    return None
+            album = self.albums_by_id.get(arg('id'))
+            return {'album': album} if album else None
+        if endpoint == 'getPlaylists':
+            return {'playlists': {'playlist': [{k: v for k, v in playlist.items() if k != 'entry'} for playlist in self.playlists]}}
+        if endpoint == 'getPlaylist':
+            playlist = next((playlist for playlist in self.playlists if playlist['id'] == arg('id')), None)
+            return {'playlist': playlist} if playlist else None
+        if endpoint == 'createPlaylist':
+            entries = [self.songs_by_id[song_id] for song_id in params.get('songId', []) if song_id in self.songs_by_id]
+            playlist = next((playlist for playlist in self.playlists if playlist['id'] == arg('playlistId')), None)
+            with self._lock:
+                if playlist is None:
+                    playlist = {'id': f"pl-{len(self.playlists)}", 'name': arg('name')}
+                    self.playlists.append(playlist)
+                playlist.update(entry=entries, songCount=len(entries), changed=time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()))
+            return {'playlist': playlist}
+        if endpoint == 'updatePlaylist':
+            playlist = next((playlist for playlist in self.playlists if playlist['id'] == arg('playlistId')), None)
+            if playlist is None: return None
+            with self._lock:
+                entries = list(playlist.get('entry', []))
+                for index in sorted({int(index) for index in params.get('songIndexToRemove', [])}, reverse=True):
+                    if index < len(entries): del entries[index]
+                entries += [self.songs_by_id[song_id] for song_id in params.get('songIdToAdd', []) if song_id in self.songs_by_id]
+                playlist.update(entry=entries, songCount=len(entries), changed=time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()))
+            return {}
+        if endpoint == 'search3':
+            words = navidrome_api.normalize_for_search(arg('query', '')).split()
+            count, offset = int(arg('songCount', 20)), int(arg('songOffset', 0))
+            if not words:
+                # Empty query: every song, paged (OpenSubsonic / Navidrome behaviour).
+                if not self.empty_search: return {'searchResult3': {}}
+                songs = [song for album in sorted(self.albums, key=lambda album: album['name']) for song in album['song']]
+                return {'searchResult3': {'song': songs[offset:offset + count]}}
+            hits = []
+            for album in self.albums:
+                for song in album['song']:
+                    haystack = navidrome_api.normalize_for_search(f"{song['artist']} {song['album']} {song['title']}")
+                    if all(word in haystack for word in words): hits.append(song)
+                    if len(hits) >= offset + count: break
+                if len(hits) >= offset + count: break
+            return {'searchResult3': {'song': hits[offset:]}}
+        return None
+
+    def _make_handler(self):
+        server = self
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.respond(urlparse(self.path).query)
+            def do_POST(self):
+                self.respond(self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8'))
+            def respond(self, query):
+                parsed = urlparse(self.path)
+                endpoint = parsed.path.rsplit('/', 1)[-1].replace('.view', '')
+                with server._lock:
+                    server.request_count += 1
+                    server.longest_url = max(server.longest_url, len(self.path))
+                    server.in_flight += 1
+                    server.peak_in_flight = max(server.peak_in_flight, server.in_flight)
+                try:
+                    if server.capacity: server.capacity.acquire()
+                    try:
+                        if server.latency: time.sleep(server.latency)
+                    finally:
+                        if server.capacity: server.capacity.release()
+                finally:
+                    with server._lock: server.in_flight -= 1
+                payload = server.handle(endpoint, parse_qs(query))
+                if payload is None: body = {'subsonic-response': {'status': 'failed', 'version': '1.16.1', 'error': {'code': 70}}}
+                else: body = {'subsonic-response': dict(payload, status='ok', version='1.16.1')}
+                data = json.dumps(body).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+            def log_message(self, *args): pass
+        return Handler
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+def format_stats(stats):
+    return f"[{stats['requests_sent']} requests, {stats['bytes_received'] / 1048576:.1f} MB, {stats['wait_time']:.2f}s waiting]"
+
+def bench_cache_build(args):
+    albums = make_library(args.albums, args.songs_per_album)
+    with FakeSubsonicServer(albums, latency=args.latency) as server:
+        client = navidrome_api.get_client(server.config())
+        sequential, seq_time = timed(navidrome_api.get_all_songs_cache, server.config(), max_workers=1)
+        seq_stats = client.stats()
+        client.reset_stats()
+        concurrent, con_time = timed(navidrome_api.get_all_songs_cache, server.config(), max_workers=args.workers)
+        con_stats = client.stats()
+    print(f"Cache build: {args.albums} albums, {len(sequential)} songs, {args.latency * 1000:.0f}ms simulated latency")
+    print(f"  sequential:              {seq_time:8.2f}s  {format_stats(seq_stats)}")
+    print(f"  concurrent ({args.workers:2d} workers): {con_time:8.2f}s  {format_stats(con_stats)}  ({seq_time / con_time:.1f}x)")
+    print(f"  identical result: {list(sequential.items()) == list(concurrent.items())}")
+    for empty_search in (True, False):
+        with FakeSubsonicServer(albums, latency=args.latency, empty_search=empty_search) as server:
+            client = navidrome_api.get_client(server.config())
+            paged, paged_time = timed(navidrome_api.get_all_songs_cache, server.config(), max_workers=args.workers, strategy='search')
+            paged_stats = client.stats()
+        # Same path -> song map as the album walk, whichever strategy actually ran.
+        assert paged == sequential
+        label = "search3 pages:          " if empty_search else "search3 unsupported:    "
+        print(f"  {label}{paged_time:8.2f}s  {format_stats(paged_stats)}  ({'paged' if empty_search else 'fell back to the album walk'}, same songs)")
+    bench_interrupted_build(args, albums, sequential)
+
+class BuildInterrupted(Exception):
+    pass
+
+def bench_interrupted_build(args, albums, expected):
+    checkpoint_file = os.path.join(tempfile.mkdtemp(prefix='navidrome_bench_'), 'song_cache.partial.db')
+    def stop_halfway(done, total):
+        if done >= total // 2: raise BuildInterrupted()
+    with FakeSubsonicServer(albums, latency=args.latency) as server:
+        client = navidrome_api.get_client(server.config())
+        try: navidrome_api.refresh_songs_cache(server.config(), None, None, args.workers, stop_halfway, None, checkpoint_file)
+        except BuildInterrupted: pass
+        client.reset_stats()
+        (resumed, _, summary), resume_time = timed(navidrome_api.refresh_songs_cache, server.config(), None, None, args.workers, None, None, checkpoint_file)
+        resume_stats = client.stats()
+    assert resumed == expected and not os.path.exists(checkpoint_file)
+    print(f"  resumed after halfway: {resume_time:8.2f}s  {format_stats(resume_stats)}  ({summary['resumed']} albums from the checkpoint, same songs)")
+    retry_delay, navidrome_api.ALBUM_RETRY_DELAY = navidrome_api.ALBUM_RETRY_DELAY, 0.05
+    try:
+        with FakeSubsonicServer(albums, latency=args.latency) as server:
+            # Two albums fail once and recover on retry; one keeps failing for the whole build.
+            server.failing_albums = {albums[1]['id']: 1, albums[2]['id']: 1, albums[3]['id']: 1000}
+            song_cache, sync_state, summary = navidrome_api.refresh_songs_cache(server.config(), max_workers=args.workers)
+            assert summary['failed'] == 1 and sync_state['incomplete'] and albums[3]['id'] not in sync_state['albums']
+            print(f"  flaky albums:          fetched {summary['fetched']} of {summary['expected']}, failed: {summary['failed_albums']}")
+            server.failing_albums = {}
+            client = navidrome_api.get_client(server.config())
+            client.reset_stats()
+            repaired, sync_state, summary = navidrome_api.refresh_songs_cache(server.config(), song_cache, sync_state, args.workers)
+            assert repaired == expected and 'incomplete' not in sync_state
+            print(f"  next quick refresh:    {format_stats(client.stats())}  fetched the {summary['added']} missing album, cache complete")
+    finally: navidrome_api.ALBUM_RETRY_DELAY = retry_delay
+
+def bench_incremental_refresh(args):
+    albums = make_library(args.albums, args.songs_per_album)
+    with FakeSubsonicServer(albums, latency=args.latency) as server:
+        client = navidrome_api.get_client(server.config())
+        song_cache, sync_state, _ = navidrome_api.refresh_songs_cache(server.config())
+        client.reset_stats()
+        _, noop_time = timed(navidrome_api.refresh_songs_cache, server.config(), song_cache, sync_state)
+        noop_stats = client.stats()
+        # Simulate a library scan that adds a few albums, retags one and deletes one.
+        new_albums = make_library(args.albums + 5, args.songs_per_album)[args.albums:]
+        server.albums = server.albums[1:] + new_albums
+        server.albums[0]['songCount'] -= 1
+        server.albums[0]['song'] = server.albums[0]['song'][:-1]
+        server.albums_by_id = {album['id']: album for album in server.albums}
+        server.last_modified += 1
+        client.reset_stats()
+        (incremental, _, summary), inc_time = timed(navidrome_api.refresh_songs_cache, server.config(), song_cache, sync_state)
+        inc_stats = client.stats()
+        full, full_time = timed(navidrome_api.get_all_songs_cache, server.config())
+    print(f"Cache refresh: {args.albums} albums, {args.latency * 1000:.0f}ms simulated latency")
+    print(f"  no-op refresh:        {noop_time:8.2f}s  {format_stats(noop_stats)}")
+    print(f"  incremental refresh:  {inc_time:8.2f}s  {format_stats(inc_stats)}  added {summary['added']}, changed {summary['changed']}, removed {summary['removed']}")
+    print(f"  full rebuild:         {full_time:8.2f}s")
+    print(f"  same songs as full rebuild: {incremental == full}")
+
+def match_quality(results, expected):
+    resolved = sum(1 for item, song_id in zip(results, expected) if item['status'] in ('ok', 'found') and item['navidrome_song']['id'] == song_id)
+    suggested = sum(1 for item, song_id in zip(results, expected) if item['status'] == 'suggestion' and item['navidrome_song']['id'] == song_id)
+    wrong = sum(1 for item, song_id in zip(results, expected) if item['navidrome_song'] and item['navidrome_song']['id'] != song_id)
+    return f"{resolved} correct, {suggested} correct suggestions, {wrong} wrong, {sum(1 for item in results if item['status'] == 'missing')} missing"
+
+def count_ratio_calls(func, *args):
+    # Counts the fuzz.ratio comparisons made while func runs.
+    calls, batch_ratio = [0], navidrome_api._batch_ratio
+    def counting(queries, choices):
+        calls[0] += len(queries)
+        return batch_ratio(queries, choices)
+    navidrome_api._batch_ratio = counting
+    try: return func(*args), calls[0]
+    finally: navidrome_api._batch_ratio = batch_ratio
+
+def bench_offline_matching(args):
+    albums = make_library(args.albums, args.songs_per_album, live_ratio=0.2)
+    tracks, expected = make_broken_playlist(albums, args.tracks, args.miss_ratio)
+    with FakeSubsonicServer(albums, latency=args.latency) as server:
+        config = server.config()
+        client = navidrome_api.get_client(config)
+        song_cache = navidrome_api.get_all_songs_cache(config)
+        _, path_index_time = timed(navidrome_api.get_path_index, song_cache)
+        client.reset_stats()
+        network_results, network_time = timed(navidrome_api.run_playlist_check, config, tracks, song_cache)
+        network_stats = client.stats()
+        song_index, index_time = timed(navidrome_api.SongIndex, song_cache)
+        client.reset_stats()
+        offline_results, offline_time = timed(navidrome_api.run_playlist_check, config, tracks, song_cache, song_index)
+        offline_stats = client.stats()
+    print(f"Playlist check: {len(tracks)} tracks, {args.miss_ratio:.0%} path misses, {len(song_cache)} songs, {args.latency * 1000:.0f}ms simulated latency")
+    loose = sum(1 for item in offline_results if item['status'] == 'found' and item['score'] == 100)
+    print(f"  path index:        {path_index_time:8.2f}s to build, {loose} moved/renamed/re-encoded paths resolved without searching")
+    print(f"  search3 per track: {network_time:8.2f}s  {format_stats(network_stats)}")
+    print(f"    {match_quality(network_results, expected)}")
+    print(f"  local index:       {offline_time:8.2f}s  {format_stats(offline_stats)}  (+{index_time:.2f}s to build the index)")
+    print(f"    {match_quality(offline_results, expected)}")
+    without_durations = [dict(track, duration=None) for track in tracks]
+    text_only_results, text_only_calls = count_ratio_calls(navidrome_api.run_playlist_check, config, without_durations, song_cache, song_index)
+    _, duration_calls = count_ratio_calls(navidrome_api.run_playlist_check, config, tracks, song_cache, song_index)
+    print(f"  ignoring #EXTINF:  {text_only_calls} fuzz.ratio calls vs {duration_calls} with duration pruning")
+    print(f"    {match_quality(text_only_results, expected)}")
+
+def bench_check_all(args):
+    # Many playlists drawn from one pool of tracks, the way real collections overlap.
+    albums = make_library(args.albums, args.songs_per_album)
+    pool, expected = make_broken_playlist(albums, args.tracks, args.miss_ratio)
+    rng = random.Random(3)
+    playlists = [rng.sample(pool, min(len(pool), 100)) for _ in range(args.playlists)]
+    with FakeSubsonicServer(albums, latency=args.latency) as server:
+        config = server.config()
+        song_cache = navidrome_api.get_all_songs_cache(config)
+    song_index = navidrome_api.SongIndex(song_cache)
+    navidrome_api.get_path_index(song_cache)
+    navidrome_api._normalize_text.cache_clear()
+    profiler = cProfile.Profile()
+    start = time.perf_counter()
+    profiler.enable()
+    baseline = [navidrome_api.run_playlist_check(config, tracks, song_cache, song_index) for tracks in playlists]
+    profiler.disable()
+    elapsed = time.perf_counter() - start
+    match_cache, version = navidrome_api.MatchCache(), navidrome_api.song_cache_version({'albums': {album['id']: album['id'] for album in albums}})
+    check_with_cache = lambda cache: [navidrome_api.run_playlist_check(config, tracks, song_cache, song_index, cache, version) for tracks in playlists]
+    shared, shared_time = timed(check_with_cache, match_cache)
+    cache_file = os.path.join(tempfile.mkdtemp(), 'match_cache.db')
+    navidrome_api.save_match_cache(cache_file, match_cache, version)
+    restarted, restarted_time = timed(check_with_cache, navidrome_api.load_match_cache(cache_file))
+    outcome = lambda runs: [[(item['status'], item['score'], item['navidrome_song'] and item['navidrome_song']['id']) for item in results] for results in runs]
+    assert outcome(shared) == outcome(baseline) and outcome(restarted) == outcome(baseline)
+    folder = tempfile.mkdtemp()
+    playlist_paths = [write_playlist(folder, f"Playlist {i:04d}", tracks) for i, tracks in enumerate(playlists)]
+    streamed = []
+    (collection, stats), collection_time = timed(navidrome_api.check_collection, config, playlist_paths, song_cache, song_index,
+                                                 playlist_callback=lambda path, results: streamed.append((path, outcome([results])[0])))
+    assert outcome(collection[path] for path in playlist_paths) == outcome(baseline)
+    assert sorted(streamed) == sorted(zip(playlist_paths, outcome(collection[path] for path in playlist_paths)))
+    info = navidrome_api._normalize_text.cache_info()
+    normalize_calls = sum(caller_stat[1] for func, stat in pstats.Stats(profiler).stats.items() if func[2] == "<built-in method unicodedata.normalize>"
+                          for caller, caller_stat in stat[4].items() if caller[2] == '_normalize_text')
+    print(f"Check All: {len(playlists)} playlists x 100 tracks from a pool of {len(pool)}, {len(song_cache)} songs")
+    print(f"  wall time: {elapsed:.2f}s")
+    print(f"  normalize_for_search: {info.hits + info.misses} lookups, {info.misses} computed ({info.hits} memoized)")
+    print(f"  unicodedata.normalize calls from normalize_for_search: {normalize_calls}")
+    print(f"  with a shared match cache: {shared_time:.2f}s ({len(match_cache.entries)} unique tracks matched)")
+    print(f"  after a restart (match cache loaded from disk): {restarted_time:.2f}s")
+    print(f"  collection planner: {collection_time:.2f}s ({stats['unique_to_match']} unique tracks matched, "
+          f"{stats['searches_run']} searches run, {stats['searches_avoided']} avoided)")
+
+def measure_memory(build):
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, used
+
+def bench_memory(args):
+    # Round-trip through JSON so strings are not shared between songs, as with a real server response.
+    albums = json.loads(json.dumps(make_library(args.albums, args.songs_per_album)))
+    raw_album_songs = lambda: json.loads(json.dumps([album['song'] for album in albums]))
+    def build_raw():
+        song_cache = {}
+        for songs in raw_album_songs():
+            for song in songs:
+                navidrome_api.normalized_song_fields(song)
+                song_cache[song['path']] = song
+        return song_cache
+    def build_slim():
+        song_cache = {}
+        navidrome_api._add_songs_to_cache(song_cache, ([navidrome_api.Song.from_subsonic(song) for song in songs] for songs in raw_album_songs()))
+        return song_cache
+    raw_cache, raw_bytes = measure_memory(build_raw)
+    song_count = len(raw_cache)
+    del raw_cache
+    slim_cache, slim_bytes = measure_memory(build_slim)
+    per_100k = lambda used: used / song_count * 100000 / 1048576
+    print(f"Song cache memory: {song_count} songs")
+    print(f"  raw Subsonic dicts: {per_100k(raw_bytes):8.1f} MB per 100k songs")
+    print(f"  slim Song records:  {per_100k(slim_bytes):8.1f} MB per 100k songs  ({raw_bytes / slim_bytes:.1f}x smaller)")
+
+def make_server_playlists(albums, count, tracks_per_playlist, seed=4):
+    rng = random.Random(seed)
+    songs = [song for album in albums for song in album['song']]
+    playlists = []
+    for i in range(count):
+        entries = rng.sample(songs, min(tracks_per_playlist, len(songs)))
+        playlists.append({'id': f"pl-{i}", 'name': f"Playlist {i:04d}", 'songCount': len(entries), 'changed': '2024-01-01T00:00:00Z', 'entry': entries})
+    return playlists
+
+def bench_sync(args):
+    albums = make_library(args.albums, args.songs_per_album)
+    with FakeSubsonicServer(albums, latency=args.latency) as server:
+        server.playlists = make_server_playlists(albums, args.playlists, 50)
+        config = server.config(navidrome_playlists_path=tempfile.mkdtemp())
+        client = navidrome_api.get_client(config)
+        client.reset_stats()
+        first, first_time = timed(navidrome_api.sync_playlists, config)
+        first_stats = client.stats()
+        client.reset_stats()
+        noop, noop_time = timed(navidrome_api.sync_playlists, config)
+        noop_stats = client.stats()
+        for playlist in server.playlists[:5]:
+            playlist['entry'] = playlist['entry'][:-1]
+            playlist['songCount'], playlist['changed'] = len(playlist['entry']), '2024-02-01T00:00:00Z'
+        client.reset_stats()
+        partial, partial_time = timed(navidrome_api.sync_playlists, config)
+        partial_stats = client.stats()
+    print(f"Sync from Server: {args.playlists} playlists, {args.latency * 1000:.0f}ms simulated latency")
+    print(f"  first sync:         {first_time:8.2f}s  {format_stats(first_stats)}  {first['written']} written")
+    print(f"  no-op sync:         {noop_time:8.2f}s  {format_stats(noop_stats)}  {noop['skipped']} skipped")
+    print(f"  5 changed on server:{partial_time:8.2f}s  {format_stats(partial_stats)}  {partial['written']} written")
+
+def bench_upload(args):
+    albums = make_library(args.albums, args.songs_per_album)
+    songs = [song for album in albums for song in album['song']]
+    tracks = random.Random(5).sample(songs, min(args.tracks, len(songs)))
+    song_cache = {song['path']: navidrome_api.Song.from_subsonic(song) for song in tracks}
+    folder = tempfile.mkdtemp()
+    print(f"Upload: {len(tracks)}-track playlist, {args.latency * 1000:.0f}ms simulated latency")
+    for form_post in (False, True):
+        with FakeSubsonicServer(albums, latency=args.latency, form_post=form_post) as server:
+            config = server.config()
+            client = navidrome_api.get_client(config)
+            label = "POST" if form_post else "GET "
+            path = write_playlist(folder, 'Bench Upload', tracks)
+            client.reset_stats()
+            _, create_time = timed(navidrome_api.upload_playlist, config, path, song_cache)
+            create_stats = client.stats()
+            edited = tracks[:len(tracks) // 2] + tracks[len(tracks) // 2 + 5:] + tracks[len(tracks) // 2:len(tracks) // 2 + 5]
+            write_playlist(folder, 'Bench Upload', edited)
+            client.reset_stats()
+            (success, message), edit_time = timed(navidrome_api.upload_playlist, config, path, song_cache)
+            edit_stats = client.stats()
+            on_server = [entry['id'] for entry in server.playlists[0]['entry']]
+            assert success and on_server == [song['id'] for song in edited], message
+            print(f"  {label} create:        {create_time:8.2f}s  {format_stats(create_stats)}")
+            print(f"  {label} move 5 tracks: {edit_time:8.2f}s  {format_stats(edit_stats)}  {message.splitlines()[-1]}")
+            print(f"  {label} longest URL:   {server.longest_url} characters")
+
+def probe_latency(url, stop, samples):
+    # Stands in for another user streaming from the same server: one small request every 50ms.
+    while not stop.is_set():
+        start = time.perf_counter()
+        try: requests.get(url + '/rest/ping.view', timeout=30)
+        except requests.exceptions.RequestException: pass
+        samples.append(time.perf_counter() - start)
+        stop.wait(0.05)
+
+def bench_adaptive_concurrency(args, capacity=4, workers=32):
+    albums = make_library(args.albums, args.songs_per_album)
+    print(f"Adaptive concurrency: {args.albums} albums, server works on {capacity} requests at once, {args.latency * 1000:.0f}ms each, {workers} threads")
+    runs = (("fixed limit", {'adaptive_concurrency': False, 'cache_workers': workers}),
+            ("adaptive (AIMD)", {'max_concurrency': workers}),
+            ("adaptive, 50 req/s cap", {'max_concurrency': workers, 'max_requests_per_second': 50}))
+    results = []
+    for label, overrides in runs:
+        with FakeSubsonicServer(albums, latency=args.latency, capacity=capacity) as server:
+            config = server.config(**overrides)
+            client = navidrome_api.get_client(config)
+            stop, samples = threading.Event(), []
+            prober = threading.Thread(target=probe_latency, args=(server.url, stop, samples), daemon=True)
+            prober.start()
+            song_cache, build_time = timed(navidrome_api.get_all_songs_cache, config, workers)
+            stop.set()
+            prober.join()
+            stats = client.stats()
+        results.append(song_cache)
+        samples.sort()
+        print(f"  {label:23s} {build_time:8.2f}s  {format_stats(stats)}  {stats['requests_sent'] / build_time:5.0f} req/s, "
+              f"peak {server.peak_in_flight} at the server, other user's request p50 {samples[len(samples) // 2] * 1000:.0f}ms / "
+              f"p90 {samples[len(samples) * 9 // 10] * 1000:.0f}ms, limit ended at {stats['concurrency_limit']}")
+    assert all(result == results[0] for result in results)
+
+BENCHMARKS = {'adaptive': bench_adaptive_concurrency, 'sync': bench_sync, 'upload': bench_upload, 'cache': bench_cache_build, 'refresh': bench_incremental_refresh, 'match': bench_offline_matching, 'checkall': bench_check_all,
+              'memory': bench_memory}
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark navidrome_api against a local fake Subsonic server.")
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS) + ['all'], nargs='?', default='all')
+    parser.add_argument('--albums', type=int, default=300)
+    parser.add_argument('--songs-per-album', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=0.02, help="Simulated server latency per request, in seconds.")
+    parser.add_argument('--tracks', type=int, default=1000, help="Playlist length for the matching benchmarks.")
+    parser.add_argument('--playlists', type=int, default=200, help="Number of overlapping playlists for the checkall benchmark.")
+    parser.add_argument('--miss-ratio', type=float, default=0.3, help="Share of playlist tracks whose path does not match the library.")
+    parser.add_argument('--workers', type=int, default=navidrome_api.DEFAULT_CACHE_WORKERS)
+    args = parser.parse_args()
+    for name in (sorted(BENCHMARKS) if args.benchmark == 'all' else [args.benchmark]):
+        BENCHMARKS[name](args)
+
+if __name__ == "__main__":
+    main()
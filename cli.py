@@ -0,0 +1,211 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import navidrome_api
+
+# Headless entry point for scheduled check/repair/sync runs, e.g. on the machine next to Navidrome.
+# Uses the same config.json, song cache and match cache as gui_app.py, so run it from the same directory.
+# The result of each command is printed to stdout as one JSON document; progress goes to stderr as
+# JSON lines ({"event": "progress", "stage": ..., "done": ..., "total": ...}) unless --quiet is given.
+
+class Progress:
+    INTERVAL = 0.5
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+
+    def event(self, event, **fields):
+        if not self.enabled: return
+        line = json.dumps(dict(event=event, time=round(time.time(), 3), **fields))
+        with self._lock: print(line, file=sys.stderr, flush=True)
+
+    def callback(self, stage):
+        # A progress_callback for navidrome_api that reports at most every INTERVAL seconds, plus the last step.
+        last = [0.0]
+        def report(done, total):
+            now = time.monotonic()
+            if done < total and now - last[0] < self.INTERVAL: return
+            last[0] = now
+            self.event('progress', stage=stage, done=done, total=total)
+        return report
+
+class BatchRun:
+    # Loads the shared caches once and saves whatever changed when the command is done.
+    def __init__(self, config, args, progress):
+        self.config, self.args, self.progress = config, args, progress
+        legacy = not os.path.exists(navidrome_api.SONG_CACHE_FILE)
+        self.song_cache, self.sync_state = navidrome_api.load_song_cache(navidrome_api.SONG_CACHE_FILE, navidrome_api.LEGACY_SONG_CACHE_FILE)
+        # Like the GUI, convert an old song_cache.json once.
+        if legacy and self.song_cache: navidrome_api.save_song_cache(navidrome_api.SONG_CACHE_FILE, self.song_cache, self.sync_state)
+        self.match_cache = navidrome_api.load_match_cache(navidrome_api.MATCH_CACHE_FILE)
+
+    def refresh_song_cache(self, full=False, strategy=None):
+        # Returns the refresh summary, or None when the server could not be read.
+        incremental = bool(self.song_cache and self.sync_state) and not full
+        self.progress.event('start', stage='cache', full=not incremental)
+        song_cache, sync_state, summary = navidrome_api.refresh_songs_cache(
+            self.config, self.song_cache if incremental else None, self.sync_state, self.args.workers,
+            self.progress.callback('cache'), strategy, navidrome_api.CACHE_CHECKPOINT_FILE)
+        if not song_cache: return None
+        self.song_cache, self.sync_state = song_cache, sync_state
+        navidrome_api.save_song_cache(navidrome_api.SONG_CACHE_FILE, song_cache, sync_state)
+        return summary
+
+    def require_song_cache(self):
+        # The GUI builds the cache on first use; so does the CLI.
+        if self.song_cache: return True
+        return self.refresh_song_cache(full=True) is not None
+
+    def cache_version(self):
+        return navidrome_api.song_cache_version(self.sync_state)
+
+    def save_match_cache(self):
+        if self.match_cache.dirty: navidrome_api.save_match_cache(navidrome_api.MATCH_CACHE_FILE, self.match_cache, self.cache_version())
+
+def _error(message):
+    return {'error': message}
+
+def _missing_connection(config):
+    if not all(config.get(key) for key in ('navidrome_url', 'navidrome_user', 'navidrome_password')):
+        return _error("Navidrome URL, user and password must be set in config.json (use the GUI's Settings once).")
+    return None
+
+def _failed(result):
+    # A run fails when the command failed or any single playlist in it did (unreadable, not written, not uploaded, not synced).
+    if 'error' in result or result.get('failed'): return True
+    return any('error' in entry or entry.get('success') is False for entry in result.get('playlists', []))
+
+def _playlist_names(folder, selected):
+    names = navidrome_api.PlaylistFolderIndex().names(folder)
+    if names is None: return None
+    selected = set(selected)
+    return [name for name in names if name in selected] if selected else names
+
+def _track_report(item):
+    song = item['navidrome_song']
+    return {'status': item['status'], 'score': item['score'], 'path': item['original_track']['path'],
+            'artist': item['original_track'].get('artist'), 'title': item['original_track'].get('title'),
+            'match': {'id': song['id'], 'path': song['path'], 'artist': song.get('artist'), 'title': song.get('title')} if song else None}
+
+def cmd_cache(run):
+    summary = run.refresh_song_cache(full=run.args.full, strategy=run.args.strategy)
+    if summary is None: return _error("Could not build the song cache. Check connection/permissions.")
+    return dict(summary, songs=len(run.song_cache))
+
+def cmd_check(run):
+    # check-all, auto-accept and save all check the local playlists first; matches remembered in the
+    # match cache (including earlier accepts) make repeated runs cheap.
+    args, config = run.args, run.config
+    folder = config['local_playlists_path']
+    names = _playlist_names(folder, args.playlist)
+    if names is None: return _error(f"Local playlists folder not found: {folder}")
+    if not run.require_song_cache(): return _error("Could not build the song cache. Check connection/permissions.")
+    song_index = navidrome_api.SongIndex(run.song_cache)
+    song_index.stale = navidrome_api.is_song_cache_stale(config, run.sync_state)
+    cache_version = run.cache_version()
+    run.progress.event('start', stage='check', playlists=len(names))
+    collection, stats = navidrome_api.check_collection(
+        config, [os.path.join(folder, name) for name in names], run.song_cache, song_index, args.workers,
+        match_cache=run.match_cache, cache_version=cache_version, progress_callback=run.progress.callback('check'))
+    min_score = getattr(args, 'min_score', None)
+    save = getattr(args, 'save', False)
+    totals = {'total': 0, 'ok': 0, 'found': 0, 'suggestion': 0, 'missing': 0, 'accepted': 0, 'playlists_saved': 0}
+    playlists = []
+    for path, results in sorted(collection.items()):
+        entry = {'name': os.path.basename(path)}
+        if not results:
+            entry['error'] = "Empty or unreadable playlist."; playlists.append(entry); continue
+        if min_score is not None:
+            accepted = navidrome_api.accept_matches(results, min_score)
+            for item in accepted: run.match_cache.remember(item, cache_version, decided=True)
+            entry['accepted'] = len(accepted)
+            totals['accepted'] += len(accepted)
+        for status in ('ok', 'found', 'suggestion', 'missing'): entry[status] = sum(1 for item in results if item['status'] == status)
+        entry['total'] = len(results)
+        if save:
+            tracks = navidrome_api.validated_tracks(results)
+            # Like Save All, a playlist is only rewritten when it has a match to apply: a [FOUND]/[SUGGESTION], or an
+            # accepted track now pointing at another path (slash direction aside). Missing tracks alone never cause a rewrite.
+            changed = any(item['status'] in ('found', 'suggestion') or (item['status'] == 'ok' and item['navidrome_song'] and
+                          item['navidrome_song']['path'].replace('\\', '/') != item['original_track']['path'].replace('\\', '/'))
+                          for item in results)
+            if changed and tracks and not args.dry_run:
+                success, error = navidrome_api.write_m3u(path, tracks)
+                if not success: entry['error'] = error
+            entry['saved'] = bool(changed and tracks and 'error' not in entry)
+            entry['written_tracks'] = len(tracks)
+            totals['playlists_saved'] += entry['saved']
+        if args.details: entry['tracks'] = [_track_report(item) for item in results if item['status'] != 'ok']
+        for key in ('total', 'ok', 'found', 'suggestion', 'missing'): totals[key] += entry[key]
+        playlists.append(entry)
+    run.save_match_cache()
+    if min_score is None: del totals['accepted']
+    if not save: del totals['playlists_saved']
+    return {'playlists': playlists, 'summary': totals, 'stats': stats, 'dry_run': bool(save and args.dry_run)}
+
+def cmd_sync(run):
+    summary = navidrome_api.sync_playlists(run.config, run.args.workers)
+    if not summary['error']: del summary['error']
+    return summary
+
+def cmd_upload_all(run):
+    folder = run.args.folder or run.config['navidrome_playlists_path']
+    if not run.require_song_cache(): return _error("Could not build the song cache. Check connection/permissions.")
+    run.progress.event('start', stage='upload', folder=folder)
+    results, error = navidrome_api.upload_all_playlists(run.config, folder, run.song_cache, run.args.workers)
+    if error: return _error(error)
+    succeeded = [result for result in results if result['success']]
+    return {'playlists': results, 'summary': {'total': len(results), 'uploaded': len(succeeded), 'failed': len(results) - len(succeeded),
+                                              'created': sum(1 for result in succeeded if result['action'] == 'created'),
+                                              'updated': sum(1 for result in succeeded if result['action'] == 'updated'),
+                                              'tracks_uploaded': sum(result['uploaded'] for result in succeeded),
+                                              'tracks_not_found': sum(result['missing'] for result in results)}}
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Headless Navidrome Playlist Manager. Prints JSON results to stdout.")
+    parser.add_argument('--workers', type=int, default=None, help="Parallel workers (default: from config.json).")
+    parser.add_argument('--quiet', action='store_true', help="Do not print JSON progress lines to stderr.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    cache = commands.add_parser('cache', help="Build or quick-refresh the server song cache.")
+    cache.add_argument('--full', action='store_true', help="Re-download everything instead of only changed albums.")
+    cache.add_argument('--strategy', choices=('albums', 'search'), default=None, help="How to fetch a full build (default: from config.json).")
+    cache.set_defaults(handler=cmd_cache)
+    for name, help_text in (('check-all', "Check every local playlist against the song cache."),
+                            ('auto-accept', "Check, then accept [FOUND]/[SUGGESTION] matches scoring at least --min-score."),
+                            ('save', "Check, then rewrite local playlists with their validated tracks.")):
+        check = commands.add_parser(name, help=help_text)
+        check.add_argument('--playlist', action='append', default=[], help="Only this playlist file name (repeatable).")
+        check.add_argument('--details', action='store_true', help="List every track that is not OK in the output.")
+        if name != 'check-all': check.add_argument('--min-score', type=float, required=name == 'auto-accept', default=None,
+                                                   help="Accept matches scoring at least this much first.")
+        if name == 'save': check.add_argument('--dry-run', action='store_true', help="Report what would be written without writing.")
+        check.set_defaults(handler=cmd_check, save=name == 'save')
+    sync = commands.add_parser('sync', help="Download changed server playlists into the Navidrome cache folder.")
+    sync.set_defaults(handler=cmd_sync)
+    upload = commands.add_parser('upload-all', help="Create or update every playlist of a folder on the server.")
+    upload.add_argument('--folder', default=None, help="Folder to upload (default: the Navidrome cache folder).")
+    upload.set_defaults(handler=cmd_upload_all)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    config = navidrome_api.load_config()
+    progress = Progress(not args.quiet)
+    result = _missing_connection(config)
+    if result is None:
+        run = BatchRun(config, args, progress)
+        client = navidrome_api.get_client(config)
+        started = time.perf_counter()
+        try: result = args.handler(run)
+        except KeyboardInterrupt: result = _error("Interrupted.")
+        result['elapsed'] = round(time.perf_counter() - started, 3)
+        result['requests'] = client.stats()
+    print(json.dumps(result, indent=2, default=str))
+    return 1 if _failed(result) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+import cProfile
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+
+MAX_SAMPLES = 10000
+PERCENTILES = (50, 90, 99)
+
+class Instrumentation:
+    # Opt-in per-stage timings. While disabled, stage() hands out a shared no-op context and costs next to nothing.
+    def __init__(self):
+        self.enabled = False
+        self._stages = {}  # name -> [count, total, max, recent samples]
+        self._lock = threading.Lock()
+        self._idle = nullcontext()
+
+    def record(self, name, elapsed):
+        with self._lock:
+            stage = self._stages.get(name)
+            if stage is None: stage = self._stages[name] = [0, 0.0, 0.0, deque(maxlen=MAX_SAMPLES)]
+            stage[0] += 1
+            stage[1] += elapsed
+            stage[2] = max(stage[2], elapsed)
+            stage[3].append(elapsed)
+
+    def stage(self, name):
+        return self._timed(name) if self.enabled else self._idle
+
+    @contextmanager
+    def _timed(self, name):
+        start = time.perf_counter()
+        try: yield
+        finally: self.record(name, time.perf_counter() - start)
+
+    def reset(self):
+        with self._lock: self._stages = {}
+
+    def snapshot(self):
+        # {stage: {count, total, mean, max, p50, p90, p99}} in seconds; percentiles cover the last MAX_SAMPLES calls.
+        with self._lock: stages = {name: (count, total, longest, sorted(samples)) for name, (count, total, longest, samples) in self._stages.items()}
+        report = {}
+        for name, (count, total, longest, samples) in sorted(stages.items()):
+            report[name] = {'count': count, 'total': total, 'mean': total / count, 'max': longest}
+            for p in PERCENTILES: report[name][f"p{p}"] = percentile(samples, p)
+        return report
+
+    def export_json(self, file_path):
+        with open(file_path, 'w', encoding='utf-8') as f:
+            json.dump({'exported': time.strftime('%Y-%m-%dT%H:%M:%S'), 'stages': self.snapshot()}, f, indent=4)
+
+def percentile(sorted_samples, p):
+    # Nearest-rank percentile of an already sorted list.
+    if not sorted_samples: return 0.0
+    return sorted_samples[min(len(sorted_samples) - 1, max(0, -(-p * len(sorted_samples) // 100) - 1))]
+
+instrumentation = Instrumentation()
+
+def stage(name):
+    return instrumentation.stage(name)
+
+def instrumented(name):
+    # Decorator form of stage(); the enabled check happens per call so it can be switched at runtime.
+    def decorate(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not instrumentation.enabled: return func(*args, **kwargs)
+            with instrumentation.stage(name): return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+_profile_lock = threading.Lock()
+
+def profile_call(profile_dir, name, func, *args, **kwargs):
+    # Runs func under cProfile and saves <profile_dir>/<name>-<timestamp>.pstats. Only the calling
+    # thread is profiled; work that func hands to a thread pool shows up as time spent waiting on it.
+    # From Python 3.12 cProfile sits on the process-wide sys.monitoring and a second active profiler
+    # raises ValueError, so one call is profiled at a time: calls that start meanwhile (or while a
+    # debugger or coverage tool holds it) run unprofiled instead of failing or waiting.
+    if not _profile_lock.acquire(blocking=False): return func(*args, **kwargs)
+    try:
+        profiler = cProfile.Profile()
+        try: profiler.enable()
+        except ValueError: return func(*args, **kwargs)
+        try: return func(*args, **kwargs)
+        finally:
+            profiler.disable()
+            os.makedirs(profile_dir, exist_ok=True)
+            stamp = time.strftime('%Y%m%d-%H%M%S') + f"-{int(time.time() * 1000) % 1000:03d}"
+            profiler.dump_stats(os.path.join(profile_dir, f"{name}-{stamp}.pstats"))
+    finally: _profile_lock.release()
@@ -1,11 +1,15 @@
 # gui_app.py
 import tkinter as tk
-from tkinter import ttk, filedialog, messagebox
+from tkinter import ttk, filedialog, messagebox, font as tkfont
 import os
 import shutil
-import json
+import queue
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+import diagnostics
 import navidrome_api
 
 try:
@@ -14,13 +18,187 @@ except ImportError:
     messagebox.showerror("Dependency Missing", "The 'thefuzz' library is required.\n\nPlease install it by running:\npip install thefuzz python-Levenshtein")
     exit()
 
+class BackgroundTasks:
+    # Runs blocking work (network, matching) off the Tk thread and hands results back through after().
+    POLL_MS = 50
+
+    def __init__(self, root, max_workers=4):
+        self.root = root
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.callbacks = queue.Queue()
+        self.latest = {}
+        self.profile_dir = None
+        self.root.after(self.POLL_MS, self._poll)
+
+    def submit(self, func, *args, on_done=None, on_error=None, key=None, profile=True):
+        # With a key, only the newest task for that key reports back; older ones are cancelled or ignored.
+        # While profile_dir is set, every task (unless profile=False) runs under cProfile and leaves a .pstats file there.
+        if key is not None and key in self.latest: self.latest[key].cancel()
+        if self.profile_dir and profile:
+            func, args = diagnostics.profile_call, (self.profile_dir, getattr(func, '__name__', 'task').strip('<>'), func) + args
+        future = self.executor.submit(func, *args)
+        if key is not None: self.latest[key] = future
+        future.add_done_callback(lambda f: self.post(self._deliver, f, key, on_done, on_error))
+        return future
+
+    def post(self, callback, *args):
+        # Safe to call from any thread: callback(*args) runs on the Tk thread.
+        self.callbacks.put((callback, args))
+
+    def _deliver(self, future, key, on_done, on_error):
+        if future.cancelled() or (key is not None and self.latest.get(key) is not future): return
+        if key is not None: del self.latest[key]
+        error = future.exception()
+        if error is not None: (on_error or self.report_error)(error)
+        elif on_done: on_done(future.result())
+
+    def report_error(self, error):
+        messagebox.showerror("Error", f"A background task failed.\n\n{error}")
+
+    def _poll(self):
+        try:
+            while True:
+                try: callback, args = self.callbacks.get_nowait()
+                except queue.Empty: break
+                try: callback(*args)
+                except Exception: self.root.report_callback_exception(*sys.exc_info())
+        finally:
+            self.root.after(self.POLL_MS, self._poll)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+class VirtualListbox(tk.Canvas):
+    # A Listbox stand-in for very long track lists: rows live in the caller's data and are drawn on
+    # demand through row_func(index) -> (text, color), so only the rows on screen exist as canvas items.
+    # Covers the part of the Listbox API the track panes use (selection, nearest, see, yview, <<ListboxSelect>>).
+    def __init__(self, master, selectbackground="#0078D7", selectforeground="white", **kwargs):
+        kwargs.setdefault('background', 'white')
+        kwargs.setdefault('highlightthickness', 1)
+        kwargs.setdefault('takefocus', 1)
+        super().__init__(master, **kwargs)
+        self.select_background, self.select_foreground = selectbackground, selectforeground
+        self.font = tkfont.nametofont('TkDefaultFont')
+        self.row_height = self.font.metrics('linespace') + 2
+        self.count, self.row_func = 0, None
+        self.top, self.selected = 0, None
+        self._yscrollcommand = None
+        self._text_items, self._highlight = [], self.create_rectangle(0, 0, 0, 0, width=0, fill=selectbackground, state='hidden')
+        self.bind("<Configure>", lambda event: self.refresh())
+        self.bind("<Button-1>", self._on_click)
+        self.bind("<Up>", lambda event: self._move_selection(-1))
+        self.bind("<Down>", lambda event: self._move_selection(1))
+        self.bind("<Prior>", lambda event: self._move_selection(-self.visible_rows()))
+        self.bind("<Next>", lambda event: self._move_selection(self.visible_rows()))
+        self.bind("<MouseWheel>", lambda event: self.yview_scroll(int(-1*(event.delta/120)), "units"))
+        # X11 has no <MouseWheel>; turn its buttons into one so a <MouseWheel> binding sees every wheel.
+        self.bind("<Button-4>", lambda event: self.event_generate("<MouseWheel>", delta=120))
+        self.bind("<Button-5>", lambda event: self.event_generate("<MouseWheel>", delta=-120))
+
+    def configure(self, cnf=None, **kwargs):
+        # The canvas never scrolls itself, so yscrollcommand is fed from refresh() instead.
+        if 'yscrollcommand' in kwargs:
+            self._yscrollcommand = kwargs.pop('yscrollcommand')
+            if cnf is None and not kwargs: return None
+        return super().configure(cnf, **kwargs)
+    config = configure
+
+    def __setitem__(self, key, value):
+        self.configure(**{key: value})
+
+    def set_rows(self, count, row_func):
+        # Shows a new list from the top with nothing selected; costs the same for 10 rows or 100,000.
+        self.count, self.row_func = count, row_func
+        self.top, self.selected = 0, None
+        self.refresh()
+
+    def refresh(self, index=None):
+        # Redraws the visible rows (or just row index, if it is on screen) after the data behind them changed.
+        if index is not None and not self.top <= index < self.top + len(self._text_items): return
+        self.top = max(0, min(self.top, self.count - self.visible_rows()))
+        rows = min(self.visible_rows() + 1, max(0, self.count - self.top))
+        while len(self._text_items) < rows: self._text_items.append(self.create_text(4, 0, anchor=tk.NW, font=self.font))
+        for slot, item in enumerate(self._text_items):
+            row = self.top + slot
+            if slot >= rows: self.itemconfigure(item, state='hidden'); continue
+            text, color = self.row_func(row)
+            fill = self.select_foreground if row == self.selected else (color or 'black')
+            self.coords(item, 4, slot * self.row_height + 1)
+            self.itemconfigure(item, text=text, fill=fill, state='normal')
+        if self.selected is not None and self.top <= self.selected < self.top + rows:
+            y = (self.selected - self.top) * self.row_height
+            self.coords(self._highlight, 0, y, self.winfo_width(), y + self.row_height)
+            self.itemconfigure(self._highlight, state='normal')
+        else: self.itemconfigure(self._highlight, state='hidden')
+        if self._yscrollcommand: self._yscrollcommand(*self.yview())
+
+    def visible_rows(self):
+        return max(1, self.winfo_height() // self.row_height)
+
+    def size(self):
+        return self.count
+
+    def get(self, index):
+        return self.row_func(index)[0] if 0 <= index < self.count else ""
+
+    def delete(self, first, last=None):
+        # Only clearing the whole list is supported; rows are changed through the data and refresh().
+        self.set_rows(0, None)
+
+    def nearest(self, y):
+        return max(0, min(self.count - 1, self.top + int(y) // self.row_height))
+
+    def curselection(self):
+        return () if self.selected is None else (self.selected,)
+
+    def selection_clear(self, first=None, last=None):
+        self.selected = None
+        self.refresh()
+
+    def selection_set(self, index):
+        self.selected = index if 0 <= index < self.count else None
+        self.refresh()
+
+    def activate(self, index):
+        pass
+
+    def see(self, index):
+        if index < self.top: self.top = index
+        elif index >= self.top + self.visible_rows(): self.top = index - self.visible_rows() + 1
+        self.refresh()
+
+    def yview(self, *args):
+        if not args:
+            if not self.count: return 0.0, 1.0
+            return self.top / self.count, min(1.0, (self.top + self.visible_rows()) / self.count)
+        if args[0] == 'moveto': self.top = int(float(args[1]) * self.count)
+        elif args[0] == 'scroll': return self.yview_scroll(int(args[1]), args[2])
+        self.refresh()
+
+    def yview_scroll(self, number, what):
+        self.top += number * (self.visible_rows() if what == 'pages' else 1)
+        self.refresh()
+
+    def _on_click(self, event):
+        self.focus_set()
+        if not self.count: return
+        self.selection_set(self.nearest(event.y))
+        self.event_generate("<<ListboxSelect>>")
+
+    def _move_selection(self, step):
+        if not self.count: return
+        self.selected = max(0, min(self.count - 1, (self.top if self.selected is None else self.selected) + step))
+        self.see(self.selected)
+        self.event_generate("<<ListboxSelect>>")
+        return "break"
+
 class SettingsWindow(tk.Toplevel):
     # This class is unchanged and correct
     def __init__(self, parent):
         super().__init__(parent)
         self.parent = parent
         self.title("Settings")
-        self.geometry("600x250")
+        self.geometry("600x340")
         self.transient(parent)
         self.grab_set()
         
@@ -45,6 +223,22 @@ class SettingsWindow(tk.Toplevel):
         ttk.Label(frame, text="Navidrome Cache Folder:").grid(row=4, column=0, sticky=tk.W, pady=2)
         ttk.Entry(frame, textvariable=self.navi_path).grid(row=4, column=1, sticky=tk.EW)
         ttk.Button(frame, text="...", command=lambda: self.browse_folder(self.navi_path), width=3).grid(row=4, column=2)
+        self.cache_strategy = tk.StringVar(value=parent.config.get('cache_strategy', 'albums'))
+        ttk.Label(frame, text="Build Song Cache From:").grid(row=5, column=0, sticky=tk.W, pady=2)
+        ttk.Combobox(frame, textvariable=self.cache_strategy, values=('albums', 'search'), state='readonly', width=10).grid(row=5, column=1, sticky=tk.W)
+        self.adaptive = tk.BooleanVar(value=parent.config.get('adaptive_concurrency', True))
+        self.max_concurrency = tk.IntVar(value=parent.config.get('max_concurrency', navidrome_api.DEFAULT_MAX_CONCURRENCY))
+        self.max_rps = tk.DoubleVar(value=parent.config.get('max_requests_per_second', 0))
+        ttk.Label(frame, text="Max Parallel Requests:").grid(row=6, column=0, sticky=tk.W, pady=2)
+        concurrency_frame = ttk.Frame(frame)
+        concurrency_frame.grid(row=6, column=1, sticky=tk.W)
+        ttk.Spinbox(concurrency_frame, from_=1, to=64, textvariable=self.max_concurrency, width=5).pack(side=tk.LEFT)
+        ttk.Checkbutton(concurrency_frame, text="Back off automatically when the server slows down", variable=self.adaptive).pack(side=tk.LEFT, padx=10)
+        ttk.Label(frame, text="Max Requests/Second:").grid(row=7, column=0, sticky=tk.W, pady=2)
+        rps_frame = ttk.Frame(frame)
+        rps_frame.grid(row=7, column=1, sticky=tk.W)
+        ttk.Spinbox(rps_frame, from_=0, to=1000, textvariable=self.max_rps, width=5).pack(side=tk.LEFT)
+        ttk.Label(rps_frame, text="(0 = no limit)").pack(side=tk.LEFT, padx=10)
         frame.columnconfigure(1, weight=1)
         button_frame = ttk.Frame(self, padding="10")
         button_frame.pack(fill=tk.X)
@@ -57,21 +251,104 @@ class SettingsWindow(tk.Toplevel):
 
     def test_connection(self):
         config = {'navidrome_url': self.url.get(), 'navidrome_user': self.user.get(), 'navidrome_password': self.pwd.get()}
-        success, message = navidrome_api.verify_connection(config)
-        messagebox.showinfo("Connection Test", message)
+        self.title("Settings - testing connection...")
+        def on_done(result):
+            if not self.winfo_exists(): return
+            self.title("Settings")
+            messagebox.showinfo("Connection Test", result[1], parent=self)
+        self.parent.tasks.submit(navidrome_api.verify_connection, config, on_done=on_done)
 
     def save_settings(self):
-        config = {'navidrome_url': self.url.get(), 'navidrome_user': self.user.get(), 'navidrome_password': self.pwd.get(),
-                  'local_playlists_path': self.local_path.get(), 'navidrome_playlists_path': self.navi_path.get()}
+        config = dict(self.parent.config)
+        config.update({'navidrome_url': self.url.get(), 'navidrome_user': self.user.get(), 'navidrome_password': self.pwd.get(),
+                       'local_playlists_path': self.local_path.get(), 'navidrome_playlists_path': self.navi_path.get(),
+                       'cache_strategy': self.cache_strategy.get(), 'adaptive_concurrency': self.adaptive.get()})
+        try: config.update(max_concurrency=max(1, self.max_concurrency.get()), max_requests_per_second=max(0.0, self.max_rps.get()))
+        except tk.TclError:
+            messagebox.showerror("Settings", "Max Parallel Requests and Max Requests/Second must be numbers.", parent=self); return
         navidrome_api.save_config(config)
-        self.parent.config = config
-        self.parent.song_cache = None
-        self.parent.last_check_results = {}
+        previous, self.parent.config = self.parent.config, config
+        # The song cache (and every check made against it) only belongs to another library when the server or login changes.
+        server_changed = any((previous.get(key) or '').strip() != config[key].strip() for key in ('navidrome_url', 'navidrome_user'))
+        if server_changed: self.parent.song_cache, self.parent.song_cache_state = None, None
+        if server_changed or previous.get('local_playlists_path') != config['local_playlists_path']: self.parent.last_check_results = {}
         self.parent.refresh_all_playlists()
         self.destroy()
 
+class DiagnosticsWindow(tk.Toplevel):
+    COLUMNS = ('count', 'total', 'mean', 'p50', 'p90', 'p99', 'max')
+    REFRESH_MS = 1000
+
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.parent = parent
+        self.title("Diagnostics")
+        self.geometry("760x420")
+        self.transient(parent)
+        self.enabled = tk.BooleanVar(value=diagnostics.instrumentation.enabled)
+        self.profiling = tk.BooleanVar(value=bool(parent.tasks.profile_dir))
+        options_frame = ttk.Frame(self, padding="10")
+        options_frame.pack(fill=tk.X)
+        ttk.Checkbutton(options_frame, text="Record stage timings", variable=self.enabled, command=self.on_toggle).pack(side=tk.LEFT)
+        ttk.Checkbutton(options_frame, text=f"Profile every operation (cProfile, saved to '{parent.PROFILE_DIR}')",
+                        variable=self.profiling, command=self.on_toggle).pack(side=tk.LEFT, padx=10)
+        table_frame = ttk.Frame(self, padding=(10, 0))
+        table_frame.pack(fill=tk.BOTH, expand=True)
+        self.table = ttk.Treeview(table_frame, columns=self.COLUMNS, selectmode='browse')
+        self.table.heading('#0', text="Stage")
+        self.table.column('#0', width=200)
+        for column in self.COLUMNS:
+            self.table.heading(column, text=column if column == 'count' else f"{column} (ms)")
+            self.table.column(column, width=75, anchor=tk.E)
+        scrollbar = ttk.Scrollbar(table_frame, orient=tk.VERTICAL, command=self.table.yview)
+        self.table['yscrollcommand'] = scrollbar.set
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.table.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        button_frame = ttk.Frame(self, padding="10")
+        button_frame.pack(fill=tk.X)
+        ttk.Button(button_frame, text="Close", command=self.destroy).pack(side=tk.RIGHT)
+        ttk.Button(button_frame, text="Export JSON...", command=self.on_export_click).pack(side=tk.RIGHT, padx=5)
+        ttk.Button(button_frame, text="Reset", command=self.on_reset_click).pack(side=tk.LEFT)
+        self.concurrency_label = ttk.Label(button_frame, text="")
+        self.concurrency_label.pack(side=tk.LEFT, padx=10)
+        self.refresh()
+
+    def on_toggle(self):
+        diagnostics.instrumentation.enabled = self.enabled.get()
+        self.parent.tasks.profile_dir = os.path.abspath(self.parent.PROFILE_DIR) if self.profiling.get() else None
+
+    def on_reset_click(self):
+        diagnostics.instrumentation.reset()
+        self.refresh(reschedule=False)
+
+    def on_export_click(self):
+        path = filedialog.asksaveasfilename(parent=self, title="Export Diagnostics", defaultextension=".json",
+                                            initialfile=f"diagnostics_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+                                            filetypes=[("JSON", "*.json")])
+        if not path: return
+        try: diagnostics.instrumentation.export_json(path)
+        except OSError as e: messagebox.showerror("Export Error", f"Could not write the file.\n\n{e}", parent=self)
+
+    def refresh(self, reschedule=True):
+        if not self.winfo_exists(): return
+        self.table.delete(*self.table.get_children())
+        for name, stage in diagnostics.instrumentation.snapshot().items():
+            values = [stage['count']] + [f"{stage[column] * 1000:.1f}" for column in self.COLUMNS[1:]]
+            self.table.insert('', tk.END, text=name, values=values)
+        client = navidrome_api.get_client(self.parent.config)
+        if client:
+            limiter = client.limiter
+            self.concurrency_label.config(text=f"Server requests: {limiter.in_flight} in flight, limit {int(limiter.limit)} of {limiter.max_limit}"
+                                               f"{' (fixed)' if not limiter.adaptive else ''}, cut back {limiter.decreases}x")
+        if reschedule: self.after(self.REFRESH_MS, self.refresh)
+
 class PlaylistToolApp(tk.Tk):
-    CACHE_FILE = "song_cache.json"
+    CACHE_FILE = navidrome_api.SONG_CACHE_FILE
+    LEGACY_CACHE_FILE = navidrome_api.LEGACY_SONG_CACHE_FILE
+    MATCH_CACHE_FILE = navidrome_api.MATCH_CACHE_FILE
+    CACHE_CHECKPOINT_FILE = navidrome_api.CACHE_CHECKPOINT_FILE
+    FOLDER_SCAN_MS = 3000
+    PROFILE_DIR = "profiles"
 
     def __init__(self):
         super().__init__()
@@ -81,7 +358,23 @@ class PlaylistToolApp(tk.Tk):
         self.config = navidrome_api.load_config()
         self.last_check_results = {}
         self.last_search_results = []
-        self.song_cache = self._load_song_cache()
+        self.last_cache_summary = None
+        self.song_index = None
+        self.check_all_running = False
+        self.cache_waiters = []
+        # Set on close so a running cache build stops and keeps its checkpoint for the next start.
+        self.closing = threading.Event()
+        self.search_after_id = None
+        self.last_search_query = None
+        self.tasks = BackgroundTasks(self)
+        # Opt-in via config.json ("instrumentation" / "profile_operations") or the Diagnostics window.
+        diagnostics.instrumentation.enabled = bool(self.config.get('instrumentation'))
+        if self.config.get('profile_operations'): self.tasks.profile_dir = os.path.abspath(self.PROFILE_DIR)
+        self.playlist_folders = navidrome_api.PlaylistFolderIndex()
+        self.song_cache, self.song_cache_state = None, None
+        self.song_cache_dirty = False
+        self.match_cache = navidrome_api.MatchCache()
+        self.cache_load_waiters = None
         self.protocol("WM_DELETE_WINDOW", self._on_closing)
 
         top_frame = ttk.Frame(self, padding="5")
@@ -89,9 +382,11 @@ class PlaylistToolApp(tk.Tk):
         search_controls_frame = ttk.Frame(top_frame)
         search_controls_frame.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(0, 5))
         ttk.Button(search_controls_frame, text="⚙️ Settings", command=self.open_settings).pack(side=tk.LEFT)
+        ttk.Button(search_controls_frame, text="Diagnostics", command=self.open_diagnostics).pack(side=tk.LEFT, padx=(5,0))
         self.search_entry = ttk.Entry(search_controls_frame)
         self.search_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=20)
         self.search_entry.bind("<Return>", self.on_search_click)
+        self.search_entry.bind("<KeyRelease>", self.on_search_typed)
         ttk.Button(search_controls_frame, text="Search", command=self.on_search_click).pack(side=tk.LEFT, padx=(0,2))
         ttk.Button(search_controls_frame, text="Replace", command=self.on_replace_click).pack(side=tk.LEFT)
         self.search_results_frame = self._create_listbox_frame(top_frame, "Search Results")
@@ -106,22 +401,23 @@ class PlaylistToolApp(tk.Tk):
         self.navi_playlists_listbox = self._add_listbox(navi_playlist_frame)
         self.navi_playlists_listbox.bind("<<ListboxSelect>>", self.on_playlist_select)
         ttk.Button(navi_playlist_frame, text="Refresh Cache", command=self.on_refresh_cache_click).pack(side=tk.BOTTOM, fill=tk.X, pady=(2,0))
+        ttk.Button(navi_playlist_frame, text="Upload All", command=self.on_upload_all_click).pack(side=tk.BOTTOM, fill=tk.X, pady=(2,0))
         ttk.Button(navi_playlist_frame, text="Upload Selected", command=self.on_upload_click).pack(side=tk.BOTTOM, fill=tk.X, pady=(2,0))
         ttk.Button(navi_playlist_frame, text="Sync from Server", command=self.sync_navidrome_playlists).pack(side=tk.BOTTOM, fill=tk.X, pady=(5,0))
         navidrome_pane.add(navi_playlist_frame, weight=1)
         self.navi_tracks_frame = self._create_listbox_frame(navidrome_pane, "Tracks (Navidrome)")
-        self.navi_tracks_listbox = self._add_listbox(self.navi_tracks_frame)
+        self.navi_tracks_listbox = self._add_listbox(self.navi_tracks_frame, virtual=True)
         navidrome_pane.add(self.navi_tracks_frame, weight=2)
         local_pane = ttk.PanedWindow(main_paned_window, orient=tk.HORIZONTAL)
         main_paned_window.add(local_pane, weight=1)
         self.local_tracks_frame = self._create_listbox_frame(local_pane, "Tracks (Local)")
-        self.local_tracks_listbox = self._add_listbox(self.local_tracks_frame)
+        self.local_tracks_listbox = self._add_listbox(self.local_tracks_frame, virtual=True)
         self.local_tracks_listbox.bind("<Shift-Button-1>", self.on_toggle_suggestion_click)
         local_pane.add(self.local_tracks_frame, weight=2)
         local_playlist_frame = self._create_listbox_frame(local_pane, "Playlists (Local)")
         self.local_playlists_listbox = self._add_listbox(local_playlist_frame)
         self.local_playlists_listbox.bind("<<ListboxSelect>>", self.on_playlist_select)
-        ttk.Button(local_playlist_frame, text="Refresh Folder", command=self.refresh_all_playlists).pack(side=tk.BOTTOM, fill=tk.X, pady=(5,0))
+        ttk.Button(local_playlist_frame, text="Refresh Folder", command=lambda: self.refresh_all_playlists(force=True)).pack(side=tk.BOTTOM, fill=tk.X, pady=(5,0))
         local_pane.add(local_playlist_frame, weight=1)
         
         bottom_frame = ttk.Frame(self, padding="5")
@@ -148,6 +444,8 @@ class PlaylistToolApp(tk.Tk):
         
         self._link_listbox_events()
         self.refresh_all_playlists()
+        self.after(self.FOLDER_SCAN_MS, self._scan_playlist_folders)
+        self._load_song_cache()
         if not self.config.get('navidrome_url'): messagebox.showinfo("Welcome", "Please configure your Navidrome server via the '⚙️ Settings' button.")
 
     def _create_listbox_frame(self, parent, title):
@@ -157,11 +455,12 @@ class PlaylistToolApp(tk.Tk):
         frame.label = label
         return frame
 
-    def _add_listbox(self, parent_frame, single_selection=False):
+    def _add_listbox(self, parent_frame, single_selection=False, virtual=False):
         listbox_frame = ttk.Frame(parent_frame)
         listbox_frame.pack(fill=tk.BOTH, expand=True, pady=(5,0))
         select_mode = tk.SINGLE if single_selection else tk.BROWSE
-        listbox = tk.Listbox(listbox_frame, selectbackground="#0078D7", selectforeground="white", exportselection=False, selectmode=select_mode)
+        if virtual: listbox = VirtualListbox(listbox_frame, selectbackground="#0078D7", selectforeground="white")
+        else: listbox = tk.Listbox(listbox_frame, selectbackground="#0078D7", selectforeground="white", exportselection=False, selectmode=select_mode)
         scrollbar = ttk.Scrollbar(listbox_frame, orient=tk.VERTICAL, command=listbox.yview)
         listbox['yscrollcommand'] = scrollbar.set
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
@@ -193,71 +492,153 @@ class PlaylistToolApp(tk.Tk):
             lb.bind("<<ListboxSelect>>", sync_selection)
 
     def _load_song_cache(self):
-        try:
-            with open(self.CACHE_FILE, 'r', encoding='utf-8') as f: return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError): return None
+        # Loads in the background so the window appears at once; cache users queue until it is done.
+        self.cache_load_waiters = []
+        def load():
+            legacy = not os.path.exists(self.CACHE_FILE)
+            return navidrome_api.load_song_cache(self.CACHE_FILE, self.LEGACY_CACHE_FILE), navidrome_api.load_match_cache(self.MATCH_CACHE_FILE), legacy
+        def on_done(result):
+            (self.song_cache, self.song_cache_state), self.match_cache, legacy = result
+            # A cache read from the old JSON file is written out as song_cache.db once, so later starts skip the JSON parse.
+            if legacy and self.song_cache:
+                self.song_cache_dirty = True
+                self._save_song_cache(in_background=True)
+            waiters, self.cache_load_waiters = self.cache_load_waiters, None
+            for then, force_refresh, incremental, on_fail in waiters: self._with_song_cache(then, force_refresh, incremental, on_fail)
+        def on_error(error):
+            on_done(((None, None), navidrome_api.MatchCache(), False))
+        self.tasks.submit(load, on_done=on_done, on_error=on_error)
 
-    def _save_song_cache(self):
-        if self.song_cache:
-            try:
-                with open(self.CACHE_FILE, 'w', encoding='utf-8') as f: json.dump(self.song_cache, f)
+    def _save_song_cache(self, in_background=False):
+        if not self.song_cache or not self.song_cache_dirty: return
+        self.song_cache_dirty = False
+        args = (self.CACHE_FILE, self.song_cache, self.song_cache_state)
+        def on_error(error):
+            self.song_cache_dirty = True
+        if in_background: self.tasks.submit(navidrome_api.save_song_cache, *args, on_done=lambda _: None, on_error=on_error)
+        else:
+            try: navidrome_api.save_song_cache(*args)
             except Exception: pass
     
+    def _save_match_cache(self, in_background=False):
+        if not self.match_cache.dirty: return
+        args = (self.MATCH_CACHE_FILE, self.match_cache, self._cache_version())
+        if in_background: self.tasks.submit(navidrome_api.save_match_cache, *args, on_done=lambda _: None, on_error=lambda error: None)
+        else:
+            try: navidrome_api.save_match_cache(*args)
+            except Exception: pass
+
+    def _cache_version(self):
+        return navidrome_api.song_cache_version(self.song_cache_state)
+
+    def _remember_decision(self, item, version=None):
+        # Accept/Replace/toggle choices survive restarts and song cache refreshes.
+        self.match_cache.remember(item, version or self._cache_version(), decided=True)
+
     def _on_closing(self):
+        self.closing.set()
+        self.tasks.shutdown()
         self._save_song_cache()
+        self._save_match_cache()
         self.destroy()
 
-    def _ensure_song_cache_exists(self, force_refresh=False):
-        if self.song_cache is None or force_refresh:
-            if not self.config.get('navidrome_url'):
-                messagebox.showerror("Error", "Please configure Navidrome in Settings first.")
-                return False
-            status_label = self.local_tracks_frame.label
-            original_text = status_label.cget("text")
-            status_label.config(text="Building server song cache (this may take a moment)...")
-            self.update_idletasks()
-            self.song_cache = navidrome_api.get_all_songs_cache(self.config)
+    def _with_song_cache(self, then, force_refresh=False, incremental=False, on_fail=None):
+        # Builds or refreshes the song cache in the background when needed, then calls then() on the Tk thread.
+        if self.cache_load_waiters is not None:
+            self.cache_load_waiters.append((then, force_refresh, incremental, on_fail)); return
+        if self.song_cache is not None and not force_refresh:
+            then(); return
+        if not self.config.get('navidrome_url'):
+            messagebox.showerror("Error", "Please configure Navidrome in Settings first.")
+            if on_fail: on_fail()
+            return
+        self.cache_waiters.append((then, on_fail))
+        if len(self.cache_waiters) > 1: return
+        status_label = self.local_tracks_frame.label
+        original_text = status_label.cget("text")
+        status_label.config(text="Building server song cache (this may take a moment)...")
+        def on_progress(done, total):
+            self.tasks.post(lambda: status_label.config(text=f"Building server song cache... {done * 100 // max(total, 1)}%"))
+        previous = self.song_cache, self.song_cache_state
+        def on_done(result):
             status_label.config(text=original_text)
-            if self.song_cache is None or not self.song_cache:
+            waiters, self.cache_waiters = self.cache_waiters, []
+            self.song_cache, self.song_cache_state, self.last_cache_summary = result
+            if not self.song_cache:
+                self.song_cache, self.song_cache_state = previous
                 messagebox.showerror("Error", "Could not build song cache. Check connection/permissions.")
-                self.song_cache = None
-                return False
-        return True
+                for _, waiter_fail in waiters:
+                    if waiter_fail: waiter_fail()
+                return
+            self.song_cache_dirty = True
+            self._save_song_cache(in_background=True)
+            self._warn_failed_albums(self.last_cache_summary)
+            for waiter, _ in waiters: waiter()
+        def on_error(error):
+            on_done((None, None, None))
+        self.tasks.submit(navidrome_api.refresh_songs_cache, self.config, self.song_cache if incremental else None, self.song_cache_state,
+                          None, on_progress, None, self.CACHE_CHECKPOINT_FILE, self.closing, on_done=on_done, on_error=on_error)
+
+    def _warn_failed_albums(self, cache_summary, limit=15):
+        if not cache_summary or not cache_summary.get('failed'): return
+        names = cache_summary['failed_albums']
+        listing = "\n".join(names[:limit]) + (f"\n...and {len(names) - limit} more" if len(names) > limit else "")
+        messagebox.showwarning("Song Cache Incomplete", f"{cache_summary['failed']} of {cache_summary['expected']} albums could not be fetched "
+                               f"and are missing from the song cache:\n\n{listing}\n\nThey will be retried on the next refresh.")
+
+    def _build_song_index(self, song_cache, sync_state, song_index):
+        if song_index is None or song_index.source is not song_cache:
+            song_index = navidrome_api.SongIndex(song_cache)
+            navidrome_api.get_path_index(song_cache)
+        song_index.stale = navidrome_api.is_song_cache_stale(self.config, sync_state)
+        return song_index
+
+    def _with_song_index(self, then, on_fail=None):
+        def on_done(song_index):
+            self.song_index = song_index
+            then(song_index)
+        def on_error(error):
+            self.tasks.report_error(error)
+            if on_fail: on_fail()
+        def build():
+            self.tasks.submit(self._build_song_index, self.song_cache, self.song_cache_state, self.song_index, on_done=on_done, on_error=on_error)
+        self._with_song_cache(build, on_fail=on_fail)
 
     def _write_m3u_file(self, filepath, tracks):
-        try:
-            with open(filepath, 'w', encoding='utf-8') as f:
-                f.write("#EXTM3U\n")
-                for track in tracks:
-                    if track and track.get('path'): f.write(f"{track['path']}\n")
-            return True, ""
-        except Exception as e:
-            return False, str(e)
+        return navidrome_api.write_m3u(filepath, tracks)
+
+    STATUS_COLORS = {'ok': 'blue', 'found': 'green', 'suggestion': 'orange', 'missing': 'red'}
+
+    @classmethod
+    def _check_result_row(cls, item):
+        track = item['original_track']
+        score = f"({item['score']:.0f}%)" if item['status'] != 'missing' else ""
+        return f"[{item['status'].upper()}] {track['artist']} - {track['title']} {score}", cls.STATUS_COLORS.get(item['status'], 'black')
+
+    @staticmethod
+    def _matched_song_row(item):
+        song = item['navidrome_song']
+        return (f"{song['artist']} - {song['title']}" if song else ""), None
 
+    @diagnostics.instrumented('gui.check_results')
     def _display_check_results(self, playlist_name, results):
-        self.local_tracks_listbox.delete(0, tk.END)
-        self.navi_tracks_listbox.delete(0, tk.END)
-        for i, item in enumerate(results):
-            track = item['original_track']
-            prefix = f"[{item['status'].upper()}]"
-            score = f"({item['score']:.0f}%)" if item['status'] != 'missing' else ""
-            local_display_text = f"{prefix} {track['artist']} - {track['title']} {score}"
-            self.local_tracks_listbox.insert(tk.END, local_display_text)
-            color = {'ok': 'blue', 'found': 'green', 'suggestion': 'orange', 'missing': 'red'}.get(item['status'], 'black')
-            self.local_tracks_listbox.itemconfig(i, {'fg': color})
-            if item['navidrome_song']:
-                navi_display_text = f"{item['navidrome_song']['artist']} - {item['navidrome_song']['title']}"
-                self.navi_tracks_listbox.insert(tk.END, navi_display_text)
-            else:
-                self.navi_tracks_listbox.insert(tk.END, "")
+        # Rows are drawn from results on demand, so Accept/Replace/toggle only need to refresh one row.
+        self.local_tracks_listbox.set_rows(len(results), lambda i: self._check_result_row(results[i]))
+        self.navi_tracks_listbox.set_rows(len(results), lambda i: self._matched_song_row(results[i]))
         self.local_tracks_frame.label.config(text=f"Check Results for '{playlist_name}'")
         self.navi_tracks_frame.label.config(text=f"Matched/Suggested Navidrome Tracks")
 
+    def _refresh_result_row(self, index):
+        self.local_tracks_listbox.refresh(index)
+        self.navi_tracks_listbox.refresh(index)
+
     def open_settings(self): SettingsWindow(self)
 
-    def refresh_all_playlists(self):
-        self.populate_playlist_listbox(self.local_playlists_listbox, self.config['local_playlists_path'])
-        self.populate_playlist_listbox(self.navi_playlists_listbox, self.config['navidrome_playlists_path'])
+    def open_diagnostics(self): DiagnosticsWindow(self)
+
+    def refresh_all_playlists(self, force=False):
+        self.populate_playlist_listbox(self.local_playlists_listbox, self.config['local_playlists_path'], force)
+        self.populate_playlist_listbox(self.navi_playlists_listbox, self.config['navidrome_playlists_path'], force)
         self.local_tracks_listbox.delete(0, tk.END)
         self.navi_tracks_listbox.delete(0, tk.END)
         self.search_results_listbox.delete(0, tk.END)
@@ -265,12 +646,32 @@ class PlaylistToolApp(tk.Tk):
         self.navi_tracks_frame.label.config(text="Tracks (Navidrome)")
         self.search_results_frame.label.config(text="Search Results")
 
-    def populate_playlist_listbox(self, listbox, folder_path):
+    def populate_playlist_listbox(self, listbox, folder_path, force=False):
+        playlists, _ = self.playlist_folders.scan(folder_path, force)
+        self._fill_playlist_listbox(listbox, playlists)
+
+    @diagnostics.instrumented('gui.playlist_list')
+    def _fill_playlist_listbox(self, listbox, playlists):
         listbox.delete(0, tk.END)
-        try:
-            playlists = [f for f in os.listdir(folder_path) if f.lower().endswith('.m3u')]
-            for p in sorted(playlists): listbox.insert(tk.END, p)
-        except FileNotFoundError: listbox.insert(tk.END, "Folder not found.")
+        if playlists is None: listbox.insert(tk.END, "Folder not found.")
+        else: listbox.insert(tk.END, *playlists)
+
+    def _scan_playlist_folders(self):
+        # Polls both folders off the Tk thread and only redraws a playlist list when its folder changed.
+        folders = [(self.local_playlists_listbox, self.config['local_playlists_path']),
+                   (self.navi_playlists_listbox, self.config['navidrome_playlists_path'])]
+        def scan():
+            return [(listbox,) + self.playlist_folders.scan(folder) for listbox, folder in folders]
+        def on_done(scans):
+            for listbox, playlists, changed in scans:
+                if not changed: continue
+                selected = listbox.get(listbox.curselection()[0]) if listbox.curselection() else None
+                self._fill_playlist_listbox(listbox, playlists)
+                if playlists and selected in playlists: listbox.selection_set(playlists.index(selected))
+            self.after(self.FOLDER_SCAN_MS, self._scan_playlist_folders)
+        def on_error(error):
+            self.after(self.FOLDER_SCAN_MS, self._scan_playlist_folders)
+        self.tasks.submit(scan, on_done=on_done, on_error=on_error, key='folder-scan', profile=False)
 
     def on_playlist_select(self, event):
         widget = event.widget
@@ -288,27 +689,49 @@ class PlaylistToolApp(tk.Tk):
             self.local_tracks_listbox.delete(0, tk.END)
             self.local_tracks_frame.label.config(text="Tracks (Local)")
         target_frame.label.config(text=f"Tracks in '{playlist_name}'")
-        tracks = navidrome_api.parse_m3u(os.path.join(folder, playlist_name))
-        target_listbox.delete(0, tk.END)
-        for track in tracks:
-            target_listbox.insert(tk.END, f"{track['artist']} - {track['title']}")
+        tracks = navidrome_api.load_playlist(os.path.join(folder, playlist_name))
+        with diagnostics.stage('gui.playlist_tracks'):
+            target_listbox.set_rows(len(tracks), lambda i: (f"{tracks[i]['artist']} - {tracks[i]['title']}", None))
             
     def sync_navidrome_playlists(self):
         if not self.config.get('navidrome_url'): messagebox.showerror("Error", "Please configure Navidrome in Settings."); return
-        self.update()
-        success, total, err = navidrome_api.download_all_playlists(self.config)
-        if err: messagebox.showerror("Sync Error", f"Error: {err}")
-        else: messagebox.showinfo("Sync Complete", f"Downloaded {success} of {total} playlists.")
-        self.refresh_all_playlists()
+        self.navi_tracks_frame.label.config(text="Syncing playlists from server...")
+        def on_done(summary):
+            if summary['error']: messagebox.showerror("Sync Error", f"Error: {summary['error']}")
+            else: messagebox.showinfo("Sync Complete", f"Synced {summary['total']} playlists.\n\n"
+                                      f"Downloaded: {summary['written']}\n"
+                                      f"Unchanged: {summary['unchanged'] + summary['skipped']}\n"
+                                      f"Failed: {summary['failed']}")
+            self.refresh_all_playlists()
+        self.tasks.submit(navidrome_api.sync_playlists, self.config, on_done=on_done)
 
     def on_search_click(self, event=None):
         query = self.search_entry.get()
         if not query: messagebox.showwarning("Search", "Please enter a search term."); return
+        self._start_search(query)
+
+    def on_search_typed(self, event):
+        if self.search_after_id: self.after_cancel(self.search_after_id)
+        self.search_after_id = None
+        query = self.search_entry.get().strip()
+        if len(query) >= 3 and query != self.last_search_query:
+            self.search_after_id = self.after(350, lambda: self._start_search(query))
+
+    def _start_search(self, query):
+        if self.search_after_id: self.after_cancel(self.search_after_id)
+        self.search_after_id = None
+        self.last_search_query = query
         self.search_results_frame.label.config(text=f"Searching for '{query}'...")
         self.search_results_listbox.delete(0, tk.END)
-        self.update()
-        self.last_search_results = navidrome_api.search_tracks(self.config, query)
+        # Keyed so a newer query supersedes one still in flight.
+        self.tasks.submit(navidrome_api.search_tracks, self.config, query, key='search',
+                          on_done=lambda results: self._display_search_results(results))
+
+    @diagnostics.instrumented('gui.search_results')
+    def _display_search_results(self, results):
+        self.last_search_results = results
         self.search_results_frame.label.config(text=f"Search Results ({len(self.last_search_results)} found)")
+        self.search_results_listbox.delete(0, tk.END)
         if not self.last_search_results:
             self.search_results_listbox.insert(tk.END, "No tracks found.")
         else:
@@ -332,74 +755,117 @@ class PlaylistToolApp(tk.Tk):
         check_item['status'] = 'ok'
         check_item['navidrome_song'] = matched_song_data
         check_item['score'] = 100
+        self._remember_decision(check_item)
         track = check_item['original_track']
-        display_text = f"[OK] {track['artist']} - {track['title']} (100%)"
-        self.local_tracks_listbox.delete(local_idx)
-        self.local_tracks_listbox.insert(local_idx, display_text)
-        self.local_tracks_listbox.itemconfig(local_idx, {'fg': 'blue'})
-        self.navi_tracks_listbox.delete(local_idx)
-        self.navi_tracks_listbox.insert(local_idx, f"{matched_song_data['artist']} - {matched_song_data['title']}")
+        self._refresh_result_row(local_idx)
         messagebox.showinfo("Success", f"Successfully linked '{track['title']}'.\n\nClick 'Save' to save this change.")
 
     def on_check_click(self, show_summary=True):
         if not self.local_playlists_listbox.curselection():
             messagebox.showwarning("Check", "Please select a local playlist to check."); return
-        if not self._ensure_song_cache_exists(): return
         playlist_name = self.local_playlists_listbox.get(self.local_playlists_listbox.curselection()[0])
         full_path = os.path.join(self.config['local_playlists_path'], playlist_name)
-        local_tracks = navidrome_api.parse_m3u(full_path)
-        if not local_tracks:
-            messagebox.showinfo("Check", f"'{playlist_name}' is empty or could not be read."); return
-        self.local_tracks_frame.label.config(text=f"Checking '{playlist_name}'...")
-        self.update()
-        results = navidrome_api.run_playlist_check(self.config, local_tracks, self.song_cache)
-        self.last_check_results[playlist_name] = results
-        self._display_check_results(playlist_name, results)
-        if show_summary:
-            messagebox.showinfo("Check Complete", f"Finished checking '{playlist_name}'.")
+        def check(song_index, cache_version):
+            local_tracks = navidrome_api.load_playlist(full_path)
+            return navidrome_api.run_playlist_check(self.config, local_tracks, self.song_cache, song_index, self.match_cache, cache_version) or None
+        def on_done(results):
+            self._save_match_cache(in_background=True)
+            if results is None:
+                self.local_tracks_frame.label.config(text="Tracks (Local)")
+                messagebox.showinfo("Check", f"'{playlist_name}' is empty or could not be read."); return
+            self.last_check_results[playlist_name] = results
+            self._display_check_results(playlist_name, results)
+            if show_summary:
+                messagebox.showinfo("Check Complete", f"Finished checking '{playlist_name}'.")
+        def start(song_index):
+            self.local_tracks_frame.label.config(text=f"Checking '{playlist_name}'...")
+            self.tasks.submit(check, song_index, self._cache_version(), on_done=on_done)
+        self._with_song_index(start)
 
     def on_check_all_click(self):
+        if self.check_all_running:
+            messagebox.showinfo("Check All", "A 'Check All' run is already in progress."); return
         if not messagebox.askyesno("Confirm Check All", "This will check every playlist in your local folder and may take some time. Continue?"):
             return
-        if not self._ensure_song_cache_exists(): return
         playlists_to_check = self.local_playlists_listbox.get(0, tk.END)
         if not playlists_to_check:
             messagebox.showinfo("Check All", "No local playlists to check.")
             return
+        self.check_all_running = True
+        def on_fail(): self.check_all_running = False
+        self._with_song_index(lambda song_index: self._start_check_all(playlists_to_check, song_index), on_fail=on_fail)
+
+    def _start_check_all(self, playlists_to_check, song_index):
         summary = {'found': 0, 'suggestion': 0, 'missing': 0, 'ok': 0, 'fixed': 0, 'total': 0}
         progress_popup = tk.Toplevel(self)
         progress_popup.title("Checking Playlists...")
-        progress_popup.geometry("400x100")
-        ttk.Label(progress_popup, text="Checking all playlists, please wait...").pack(pady=10)
+        progress_popup.geometry("400x140")
+        status_label = ttk.Label(progress_popup, text=f"Reading {len(playlists_to_check)} playlists...")
+        status_label.pack(pady=10)
         progress_bar = ttk.Progressbar(progress_popup, orient='horizontal', mode='determinate', length=380)
-        progress_bar.pack(pady=10)
-        progress_bar['maximum'] = len(playlists_to_check)
-        self.update()
-        for i, playlist_name in enumerate(playlists_to_check):
-            full_path = os.path.join(self.config['local_playlists_path'], playlist_name)
-            local_tracks = navidrome_api.parse_m3u(full_path)
-            if not local_tracks: continue
-            results = navidrome_api.run_playlist_check(self.config, local_tracks, self.song_cache)
+        progress_bar.pack(pady=5)
+        cancel_event = threading.Event()
+        ttk.Button(progress_popup, text="Cancel", command=cancel_event.set).pack(pady=5)
+        progress_popup.protocol("WM_DELETE_WINDOW", cancel_event.set)
+        playlist_paths = [os.path.join(self.config['local_playlists_path'], name) for name in playlists_to_check]
+        cache_version = self._cache_version()
+
+        def on_progress(done, total):
+            progress_bar['maximum'] = max(total, 1)
+            progress_bar['value'] = done
+            status_label.config(text=f"Matching unique tracks: {done}/{total}")
+
+        def on_playlist_checked(path, results):
+            # Each playlist shows up as soon as all of its tracks are matched, not when the whole run ends.
+            if not results: return
+            playlist_name = os.path.basename(path)
             self.last_check_results[playlist_name] = results
             for item in results:
                 summary.setdefault(item['status'], 0)
                 summary[item['status']] += 1
                 summary['total'] += 1
-            progress_bar['value'] = i + 1
-            self.update()
+            selection = self.local_playlists_listbox.curselection()
+            if selection and self.local_playlists_listbox.get(selection[0]) == playlist_name: self._display_check_results(playlist_name, results)
+
+        def worker():
+            progress = lambda done, total: self.tasks.post(on_progress, done, total)
+            checked = lambda path, results: self.tasks.post(on_playlist_checked, path, results)
+            return navidrome_api.check_collection(self.config, playlist_paths, self.song_cache, song_index, cancel_event=cancel_event,
+                                                  match_cache=self.match_cache, cache_version=cache_version, progress_callback=progress,
+                                                  playlist_callback=checked)
+
+        def on_done(result):
+            collection, stats = result
+            self._finish_check_all(progress_popup, summary, len(collection), len(playlists_to_check), stats['cancelled'], stats)
+
+        def on_error(error):
+            self._finish_check_all(progress_popup, summary, 0, len(playlists_to_check), cancel_event.is_set())
+            self.tasks.report_error(error)
+
+        self.tasks.submit(worker, on_done=on_done, on_error=on_error)
+
+    def _finish_check_all(self, progress_popup, summary, checked_count, total_count, cancelled, stats=None):
+        self.check_all_running = False
+        self._save_match_cache(in_background=True)
         progress_popup.destroy()
         ok_total = summary.get('ok', 0) + summary.get('fixed', 0)
-        summary_message = f"Finished checking {len(playlists_to_check)} playlists.\n\n"
+        if cancelled: summary_message = f"Cancelled after checking {checked_count} of {total_count} playlists.\n\n"
+        else: summary_message = f"Finished checking {total_count} playlists.\n\n"
         summary_message += f"Total Tracks: {summary['total']}\n"
         summary_message += f"--------------------\n"
         summary_message += f"OK: {ok_total}\n"
         summary_message += f"Found: {summary['found']}\n"
         summary_message += f"Suggestions: {summary['suggestion']}\n"
         summary_message += f"Missing: {summary['missing']}"
+        if stats:
+            summary_message += f"\n--------------------\n"
+            summary_message += f"Unique tracks matched: {stats['matched']}\n"
+            summary_message += f"Searches run: {stats['searches_run']} ({stats['searches_avoided']} avoided)"
         messagebox.showinfo("Check All Complete", summary_message)
         if self.local_playlists_listbox.curselection():
             playlist_name = self.local_playlists_listbox.get(self.local_playlists_listbox.curselection()[0])
-            self._display_check_results(playlist_name, self.last_check_results[playlist_name])
+            if playlist_name in self.last_check_results:
+                self._display_check_results(playlist_name, self.last_check_results[playlist_name])
     
     def on_accept_click(self):
         if not self.local_playlists_listbox.curselection():
@@ -414,11 +880,9 @@ class PlaylistToolApp(tk.Tk):
         if check_item['status'] in ['suggestion', 'found']:
             check_item['status'] = 'ok'
             check_item['score'] = 100
+            self._remember_decision(check_item)
             track = check_item['original_track']
-            display_text = f"[OK] {track['artist']} - {track['title']} (100%)"
-            self.local_tracks_listbox.delete(selected_index)
-            self.local_tracks_listbox.insert(selected_index, display_text)
-            self.local_tracks_listbox.itemconfig(selected_index, {'fg': 'blue'})
+            self._refresh_result_row(selected_index)
             messagebox.showinfo("Suggestion Accepted", f"'{track['title']}' has been accepted.\n\nClick 'Save' to save this change.")
         elif check_item['status'] == 'ok':
             messagebox.showinfo("Accept", "This track is already OK.")
@@ -433,7 +897,7 @@ class PlaylistToolApp(tk.Tk):
             messagebox.showerror("Save Error", "Please run a 'Check' on this playlist first."); return
         
         results = self.last_check_results[playlist_name]
-        tracks_to_write = [item['navidrome_song'] for item in results if item['status'] in ['ok', 'found']]
+        tracks_to_write = navidrome_api.validated_tracks(results)
         
         if not tracks_to_write and all(item['status'] != 'ok' for item in results):
              messagebox.showinfo("Save", "No tracks were found or accepted. Nothing to save."); return
@@ -490,26 +954,77 @@ class PlaylistToolApp(tk.Tk):
     def on_upload_click(self):
         if not self.navi_playlists_listbox.curselection():
             messagebox.showwarning("Upload", "Please select a playlist from the cache to upload."); return
-        if not self._ensure_song_cache_exists(): return
         playlist_name = self.navi_playlists_listbox.get(self.navi_playlists_listbox.curselection()[0])
         full_path = os.path.join(self.config['navidrome_playlists_path'], playlist_name)
         if not messagebox.askyesno("Confirm Upload", f"This will create or overwrite the playlist '{os.path.splitext(playlist_name)[0]}' on your Navidrome server.\n\nProceed?"):
             return
         original_label_text = self.navi_tracks_frame.label.cget("text")
-        self.navi_tracks_frame.label.config(text=f"Uploading '{playlist_name}'...")
-        self.update_idletasks()
-        success, message = navidrome_api.upload_playlist(self.config, full_path, self.song_cache)
-        if success:
-            messagebox.showinfo("Upload Complete", message)
-            self.sync_navidrome_playlists()
-        else:
-            messagebox.showerror("Upload Failed", message)
-        self.navi_tracks_frame.label.config(text=original_label_text)
+        def on_done(result):
+            success, message = result
+            self.navi_tracks_frame.label.config(text=original_label_text)
+            if success:
+                messagebox.showinfo("Upload Complete", message)
+                self.sync_navidrome_playlists()
+            else:
+                messagebox.showerror("Upload Failed", message)
+        def start():
+            self.navi_tracks_frame.label.config(text=f"Uploading '{playlist_name}'...")
+            self.tasks.submit(navidrome_api.upload_playlist, self.config, full_path, self.song_cache, on_done=on_done)
+        self._with_song_cache(start)
     
+    def on_upload_all_click(self):
+        folder = self.config['navidrome_playlists_path']
+        playlist_count = len([name for name in self.navi_playlists_listbox.get(0, tk.END) if name.lower().endswith('.m3u')])
+        if not playlist_count:
+            messagebox.showinfo("Upload All", "There are no playlists in the Navidrome Cache folder."); return
+        if not messagebox.askyesno("Confirm Upload All", f"This will create or overwrite {playlist_count} playlists on your Navidrome server.\n\nProceed?"):
+            return
+        original_label_text = self.navi_tracks_frame.label.cget("text")
+        def on_done(outcome):
+            results, error = outcome
+            self.navi_tracks_frame.label.config(text=original_label_text)
+            if error: messagebox.showerror("Upload Failed", error); return
+            succeeded = [r for r in results if r['success']]
+            failed = [r for r in results if not r['success']]
+            message = (f"Uploaded {len(succeeded)} of {len(results)} playlists.\n\n"
+                       f"Created: {sum(1 for r in succeeded if r['action'] == 'created')}\n"
+                       f"Updated: {sum(1 for r in succeeded if r['action'] == 'updated')}\n"
+                       f"Tracks Uploaded: {sum(r['uploaded'] for r in succeeded)}\n"
+                       f"Tracks Not Found: {sum(r['missing'] for r in results)}")
+            if failed:
+                message += "\n\nFailed:\n" + "\n".join(f"  - {r['name']}: {r['message']}" for r in failed[:15])
+                if len(failed) > 15: message += f"\n  ... and {len(failed) - 15} more"
+            (messagebox.showwarning if failed else messagebox.showinfo)("Upload All Complete", message)
+            self.sync_navidrome_playlists()
+        def start():
+            self.navi_tracks_frame.label.config(text=f"Uploading {playlist_count} playlists...")
+            self.tasks.submit(navidrome_api.upload_all_playlists, self.config, folder, self.song_cache, on_done=on_done)
+        self._with_song_cache(start)
+
     def on_refresh_cache_click(self):
-        if messagebox.askyesno("Confirm Refresh", "This will re-download all track data from the server and may take a moment. Are you sure?"):
-            if self._ensure_song_cache_exists(force_refresh=True):
-                messagebox.showinfo("Success", f"Song cache refreshed successfully.\nFound {len(self.song_cache)} tracks.")
+        if self.cache_waiters:
+            messagebox.showinfo("Refresh Cache", "The song cache is already being built."); return
+        incremental = bool(self.song_cache and self.song_cache_state)
+        if incremental:
+            choice = messagebox.askyesnocancel("Refresh Cache", "Quick refresh: only fetch albums that were added or changed since the last sync?\n\n"
+                                               "Yes = quick refresh\nNo = re-download everything (may take a while)")
+            if choice is None: return
+            incremental = choice
+        elif not messagebox.askyesno("Confirm Refresh", "This will re-download all track data from the server and may take a moment. Are you sure?"):
+            return
+        client = navidrome_api.get_client(self.config)
+        if client: client.reset_stats()
+        def on_done():
+            stats, cache_summary = client.stats(), self.last_cache_summary
+            messagebox.showinfo("Success", f"Song cache refreshed successfully.\nFound {len(self.song_cache)} tracks.\n"
+                                f"Albums added: {cache_summary['added']}, changed: {cache_summary['changed']}, removed: {cache_summary['removed']}\n"
+                                f"Albums fetched: {cache_summary['fetched']} of {cache_summary['expected']} "
+                                f"(resumed: {cache_summary['resumed']}, failed: {cache_summary['failed']})\n\n"
+                                f"Requests: {stats['requests_sent']} ({stats['failures']} failed), up to {stats['peak_concurrency_limit']} at once, "
+                                f"slowed down {stats['throttled']}x for server load\n"
+                                f"Received: {stats['bytes_received'] / 1048576:.1f} MB\n"
+                                f"Time waiting on server: {stats['wait_time']:.1f}s")
+        self._with_song_cache(on_done, force_refresh=True, incremental=incremental)
 
     def on_merge_click(self, mode):
         if not self.navi_playlists_listbox.curselection() or not self.local_playlists_listbox.curselection():
@@ -519,18 +1034,19 @@ class PlaylistToolApp(tk.Tk):
         local_name = self.local_playlists_listbox.get(self.local_playlists_listbox.curselection()[0])
         navi_path = os.path.join(self.config['navidrome_playlists_path'], navi_name)
         local_path = os.path.join(self.config['local_playlists_path'], local_name)
-        navi_tracks = navidrome_api.parse_m3u(navi_path)
-        local_tracks = navidrome_api.parse_m3u(local_path)
+        # Both files are read lazily while the result is written, so neither is held in memory.
+        navi_tracks = navidrome_api.iter_m3u(navi_path, extended=True)
+        local_tracks = navidrome_api.iter_m3u(local_path, extended=True)
         if mode == 'left':
-            merged_tracks = navidrome_api.merge_playlists(navi_tracks, local_tracks)
+            merged_tracks = navidrome_api.iter_merged_tracks(navi_tracks, local_tracks)
             dest_path = navi_path
             if not messagebox.askyesno("Confirm Overwrite", f"This will merge '{local_name}' into '{navi_name}' and overwrite it in the Navidrome Cache. Proceed?"): return
         elif mode == 'right':
-            merged_tracks = navidrome_api.merge_playlists(local_tracks, navi_tracks)
+            merged_tracks = navidrome_api.iter_merged_tracks(local_tracks, navi_tracks)
             dest_path = local_path
             if not messagebox.askyesno("Confirm Overwrite", f"This will merge '{navi_name}' into '{local_name}' and overwrite it in the Local Playlists. Proceed?"): return
         else:
-            merged_tracks = navidrome_api.merge_playlists(navi_tracks, local_tracks)
+            merged_tracks = navidrome_api.iter_merged_tracks(navi_tracks, local_tracks)
             dest_path = filedialog.asksaveasfilename(
                 initialdir=self.config['local_playlists_path'], title="Save Merged Playlist As",
                 defaultextension=".m3u", filetypes=[("M3U Playlist", "*.m3u")]
@@ -605,11 +1121,9 @@ class PlaylistToolApp(tk.Tk):
         if not messagebox.askyesno("Confirm Accept All", f"This will accept all [FOUND] and [SUGGESTION] tracks in '{playlist_name}'.\n\nAre you sure?"):
             return
         results = self.last_check_results[playlist_name]
-        for item in results:
-            if item['status'] in ['found', 'suggestion']:
-                item['status'] = 'ok'
-                item['score'] = 100
-        self._display_check_results(playlist_name, results)
+        cache_version = self._cache_version()
+        for item in navidrome_api.accept_matches(results): self._remember_decision(item, cache_version)
+        self.local_tracks_listbox.refresh()
 
     def on_save_all_click(self):
         if not self.last_check_results:
@@ -620,7 +1134,7 @@ class PlaylistToolApp(tk.Tk):
         
         saved_count = 0
         for playlist_name, results in self.last_check_results.items():
-            tracks_to_write = [item['navidrome_song'] for item in results if item['status'] in ['ok', 'found']]
+            tracks_to_write = navidrome_api.validated_tracks(results)
             # Only save if there are changes to be made.
             if tracks_to_write and any(item['status'] in ['found', 'suggestion'] for item in results):
                 output_path = os.path.join(self.config['local_playlists_path'], playlist_name)
@@ -639,6 +1153,9 @@ class PlaylistToolApp(tk.Tk):
         selected_index = self.local_tracks_listbox.nearest(event.y)
         self.local_tracks_listbox.selection_clear(0, tk.END)
         self.local_tracks_listbox.selection_set(selected_index)
+        # Shift+Click selects the row like a plain click does, so the matched-song pane follows it.
+        self.local_tracks_listbox.focus_set()
+        self.local_tracks_listbox.event_generate("<<ListboxSelect>>")
         
         check_item = self.last_check_results[playlist_name][selected_index]
         
@@ -648,15 +1165,8 @@ class PlaylistToolApp(tk.Tk):
         
         if new_status:
             check_item['status'] = new_status
-            track = check_item['original_track']
-            prefix = f"[{new_status.upper()}]"
-            score = f"({check_item['score']:.0f}%)"
-            display_text = f"{prefix} {track['artist']} - {track['title']} {score}"
-            color = 'orange' if new_status == 'suggestion' else 'green'
-            
-            self.local_tracks_listbox.delete(selected_index)
-            self.local_tracks_listbox.insert(selected_index, display_text)
-            self.local_tracks_listbox.itemconfig(selected_index, {'fg': color})
+            self._remember_decision(check_item)
+            self.local_tracks_listbox.refresh(selected_index)
 
 if __name__ == "__main__":
     app = PlaylistToolApp()
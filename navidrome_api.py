@@ -1,18 +1,49 @@
+import gc
 import os
 import json
+import math
 import re
 import requests
 import random
+import sqlite3
 import string
+import sys
+import tempfile
+import threading
+import time
+import heapq
 import unicodedata
+from collections import OrderedDict, defaultdict
+from functools import lru_cache
 from hashlib import md5
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlencode
+from urllib3.util.retry import Retry
+
+import diagnostics
 
 try:
     from thefuzz import fuzz
 except ImportError:
     pass
 
+try:
+    import numpy
+    from rapidfuzz.fuzz import ratio as _rf_ratio
+    from rapidfuzz.process import cpdist as _cpdist
+except ImportError:
+    _cpdist = None
+
 CONFIG_FILE = "config.json"
+# Shared by the GUI and the CLI, relative to the working directory like CONFIG_FILE.
+SONG_CACHE_FILE = "song_cache.db"
+LEGACY_SONG_CACHE_FILE = "song_cache.json"
+MATCH_CACHE_FILE = "match_cache.db"
+CACHE_CHECKPOINT_FILE = "song_cache.partial.db"
+DEFAULT_CACHE_WORKERS = 8
+DEFAULT_CHECK_WORKERS = 4
+DEFAULT_MAX_CONCURRENCY = 16
 
 # --- All other functions are unchanged and correct ---
 
@@ -29,6 +60,12 @@ def load_config():
     if 'navidrome_password' not in config: config['navidrome_password'] = ""
     if 'local_playlists_path' not in config: config['local_playlists_path'] = default_local_path
     if 'navidrome_playlists_path' not in config: config['navidrome_playlists_path'] = default_navi_path
+    if 'cache_workers' not in config: config['cache_workers'] = DEFAULT_CACHE_WORKERS
+    if 'check_workers' not in config: config['check_workers'] = DEFAULT_CHECK_WORKERS
+    if 'cache_strategy' not in config: config['cache_strategy'] = 'albums'
+    if 'adaptive_concurrency' not in config: config['adaptive_concurrency'] = True
+    if 'max_concurrency' not in config: config['max_concurrency'] = DEFAULT_MAX_CONCURRENCY
+    if 'max_requests_per_second' not in config: config['max_requests_per_second'] = 0
     os.makedirs(config['local_playlists_path'], exist_ok=True)
     os.makedirs(config['navidrome_playlists_path'], exist_ok=True)
     return config
@@ -39,210 +76,1321 @@ def save_config(config_data):
 def verify_connection(config):
     if not all([config.get('navidrome_url'), config.get('navidrome_user'), config.get('navidrome_password')]):
         return False, "URL, Username, and Password must be filled."
-    ping_res = send_api_request(config['navidrome_url'], config['navidrome_user'], config['navidrome_password'], 'ping')
+    ping_res = api_request(config, 'ping')
     if ping_res: return True, "Connection successful!"
     else: return False, "Connection failed. Check URL, credentials, and network."
 
-def normalize_for_search(text):
-    if not isinstance(text, str): return ""
+@lru_cache(maxsize=262144)
+def _normalize_text(text):
     text = unicodedata.normalize('NFKD', text.lower())
     text = ''.join(c for c in text if not unicodedata.combining(c))
     text = re.sub(r'[^a-z0-9\s]', '', text)
     return text
 
+def normalize_for_search(text):
+    if not isinstance(text, str): return ""
+    return _normalize_text(text)
+
+def normalized_song_fields(song):
+    # (title, album, artist) normalized once and kept on the song record itself.
+    fields = song.get('_normalized')
+    if fields is None:
+        fields = song['_normalized'] = (normalize_for_search(song.get('title', '')), normalize_for_search(song.get('album', '')),
+                                        normalize_for_search(song.get('artist', '')))
+    return fields
+
+# Slim cached song: only the fields matching and uploading read, with artist/album strings shared
+# between songs. Supports the dict-style access used for raw Subsonic songs (song['id'], song.get('title')).
+class Song:
+    __slots__ = ('id', 'path', 'title', 'artist', 'album', 'albumId', 'duration', '_normalized')
+
+    def __init__(self, id, path, title=None, artist=None, album=None, albumId=None, duration=None, _normalized=None):
+        self.id, self.path, self.title, self.duration = id, path, title, duration
+        self.artist = sys.intern(artist) if artist else artist
+        self.album = sys.intern(album) if album else album
+        self.albumId = sys.intern(albumId) if albumId else albumId
+        self._normalized = tuple(sys.intern(field) for field in _normalized) if _normalized else None
+
+    @classmethod
+    def from_subsonic(cls, song):
+        return cls(song['id'], song['path'], song.get('title'), song.get('artist'), song.get('album'),
+                   song.get('albumId') or song.get('parent'), song.get('duration'))
+
+    def __getitem__(self, key):
+        try: return getattr(self, key)
+        except (AttributeError, TypeError): raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in self.__slots__ and getattr(self, key, None) is not None
+
+    def get(self, key, default=None):
+        value = getattr(self, key, None) if key in self.__slots__ else None
+        return default if value is None else value
+
+    def as_dict(self):
+        return {key: getattr(self, key) for key in self.__slots__ if key != '_normalized'}
+
+    def __eq__(self, other):
+        return isinstance(other, Song) and all(getattr(self, key) == getattr(other, key) for key in self.__slots__)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"Song({self.as_dict()!r})"
+
 def sanitize_filename(name):
     return re.sub(r'[\\/*?:"<>|]', "", name)
 
-def send_api_request(base_url, username, password, endpoint, **kwargs):
+class ConcurrencyLimiter:
+    # Caps the requests in flight with AIMD: the limit grows by one for each limit's worth of healthy
+    # responses and is cut when a request fails (timeout, connection error, 5xx) or when its latency
+    # climbs past LATENCY_TOLERANCE times the best recent latency for that endpoint, i.e. the server
+    # has started queueing. Responses to requests sent before the last cut don't count, so one slow
+    # burst only cuts once. An optional requests-per-second cap spaces out request starts.
+    LATENCY_TOLERANCE = 2.0
+    LATENCY_SLACK = 0.01
+    BASELINE_DRIFT = 0.005
+    ERROR_BACKOFF = 0.5
+    LATENCY_BACKOFF = 0.8
+
+    def __init__(self, initial_limit=DEFAULT_CACHE_WORKERS, max_limit=DEFAULT_MAX_CONCURRENCY, max_rps=0, adaptive=True, min_limit=1):
+        self.min_limit = min_limit
+        self.configure(max_limit, max_rps, adaptive)
+        self.limit = float(min(max(initial_limit, min_limit), self.max_limit))
+        self.in_flight = 0
+        self.peak_limit = self.limit
+        self.decreases = 0
+        self.baselines = {}  # endpoint -> best recent latency (s)
+        self._last_decrease = 0.0
+        self._next_start = 0.0
+        self._cond = threading.Condition()
+
+    def configure(self, max_limit, max_rps=0, adaptive=True):
+        self.max_limit = max(self.min_limit, int(max_limit))
+        self.max_rps = float(max_rps or 0)
+        self.adaptive = adaptive
+        if not adaptive or getattr(self, 'limit', 0) > self.max_limit: self.limit = float(self.max_limit)
+
+    def acquire(self):
+        # Blocks until a request may start; returns its start time for release().
+        with self._cond:
+            while self.in_flight >= int(self.limit): self._cond.wait()
+            self.in_flight += 1
+            now = time.monotonic()
+            delay = 0.0
+            if self.max_rps:
+                delay = max(0.0, self._next_start - now)
+                self._next_start = max(now, self._next_start) + 1.0 / self.max_rps
+        if delay: time.sleep(delay)
+        return time.monotonic()
+
+    def release(self, started, endpoint, overloaded=False):
+        latency = time.monotonic() - started
+        with self._cond:
+            self.in_flight -= 1
+            if self.adaptive: self._adjust(started, endpoint, latency, overloaded)
+            self._cond.notify_all()
+
+    def _adjust(self, started, endpoint, latency, overloaded):
+        baseline = self.baselines.get(endpoint)
+        if not overloaded:
+            self.baselines[endpoint] = latency if baseline is None else min(latency, baseline * (1 + self.BASELINE_DRIFT))
+        if started < self._last_decrease: return
+        slow = baseline is not None and latency > baseline * self.LATENCY_TOLERANCE + self.LATENCY_SLACK
+        if overloaded or slow:
+            self.limit = max(float(self.min_limit), self.limit * (self.ERROR_BACKOFF if overloaded else self.LATENCY_BACKOFF))
+            self._last_decrease = time.monotonic()
+            self.decreases += 1
+        elif self.in_flight + 1 >= int(self.limit):
+            # Only grow while the limit is actually what holds requests back.
+            self.limit = min(float(self.max_limit), self.limit + 1.0 / self.limit)
+            self.peak_limit = max(self.peak_limit, self.limit)
+
+# One pooled keep-alive session per server/login, shared by every API call below.
+class NavidromeClient:
+    RETRY_STATUSES = (500, 502, 503, 504)
+    # Retrying these after the server may have seen them could apply a change twice.
+    MODIFYING_ENDPOINTS = frozenset(['createPlaylist', 'updatePlaylist', 'deletePlaylist'])
+
+    def __init__(self, base_url, username, password, timeout=30, retries=3, backoff=0.5, pool_size=DEFAULT_CACHE_WORKERS, limiter=None):
+        url = base_url.strip()
+        if not url.endswith('/'): url += '/'
+        if not url.endswith('/rest/'): url += 'rest/'
+        self.base_url = url
+        self.timeout, self.pool_size = timeout, pool_size
+        # Subsonic accepts a salt/token pair for any number of requests, so it is derived once per client.
+        salt = ''.join(random.choice(string.ascii_letters + string.digits) for _ in range(7))
+        token = md5((password + salt).encode('utf-8')).hexdigest()
+        self.auth_params = {'f': 'json', 'u': username, 'v': '1.16.1', 'c': 'PlaylistToolGUI', 't': token, 's': salt}
+        retry = Retry(total=retries, connect=retries, read=retries, backoff_factor=backoff, status_forcelist=self.RETRY_STATUSES,
+                      allowed_methods=frozenset(['GET', 'POST']), raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(10, pool_size), max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        write_adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(10, pool_size),
+                                    max_retries=Retry(total=retries, connect=retries, read=0, status=0, backoff_factor=backoff))
+        self.write_session = requests.Session()
+        self.write_session.mount('http://', write_adapter)
+        self.write_session.mount('https://', write_adapter)
+        self.limiter = limiter or ConcurrencyLimiter(pool_size, max(pool_size, DEFAULT_MAX_CONCURRENCY))
+        self.limiter_settings = None
+        self._extensions = None
+        self._stats_lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self.requests_sent, self.bytes_received, self.wait_time, self.failures = 0, 0, 0.0, 0
+        with self.limiter._cond: self.limiter.peak_limit, self.limiter.decreases = self.limiter.limit, 0
+
+    def stats(self):
+        with self._stats_lock:
+            return {'requests_sent': self.requests_sent, 'bytes_received': self.bytes_received,
+                    'wait_time': self.wait_time, 'failures': self.failures, 'concurrency_limit': int(self.limiter.limit),
+                    'peak_concurrency_limit': int(self.limiter.peak_limit), 'throttled': self.limiter.decreases}
+
+    def _record(self, bytes_received, elapsed, failed):
+        with self._stats_lock:
+            self.requests_sent += 1
+            self.bytes_received += bytes_received
+            self.wait_time += elapsed
+            if failed: self.failures += 1
+
+    def request(self, endpoint, http_method='GET', **kwargs):
+        params = dict(self.auth_params)
+        query = kwargs.pop('query', None)
+        params.update(kwargs)
+        if query is not None: params['query'] = query
+        session = self.write_session if endpoint in self.MODIFYING_ENDPOINTS else self.session
+        # Only transport errors and 5xx/429 mean the server is struggling; a Subsonic error reply does not.
+        with diagnostics.stage('http.queue'): started = self.limiter.acquire()
+        start, res, overloaded = time.perf_counter(), None, False
+        try:
+            with diagnostics.stage(f"http.{endpoint}"):
+                if http_method == 'POST': res = session.post(self.base_url + endpoint + ".view", data=params, timeout=self.timeout)
+                else: res = session.get(self.base_url + endpoint + ".view", params=params, timeout=self.timeout)
+            overloaded = res.status_code >= 500 or res.status_code == 429
+            res.raise_for_status()
+            with diagnostics.stage('http.json_decode'): res_json = res.json()
+            if 'subsonic-response' in res_json and res_json['subsonic-response'].get('status') == 'ok':
+                self._record(len(res.content), time.perf_counter() - start, False)
+                return res_json['subsonic-response']
+        except requests.exceptions.HTTPError: pass
+        # requests' JSONDecodeError is also a RequestException; a non-JSON reply (proxy login page, XML) is not overload.
+        except ValueError: pass
+        except requests.exceptions.RequestException: overloaded = True
+        finally: self.limiter.release(started, endpoint, overloaded)
+        self._record(len(res.content) if res is not None else 0, time.perf_counter() - start, True)
+        return None
+
+    def url_length(self, endpoint, **kwargs):
+        params = dict(self.auth_params)
+        params.update(kwargs)
+        return len(requests.Request('GET', self.base_url + endpoint + ".view", params=params).prepare().url)
+
+    def supports_extension(self, name):
+        # OpenSubsonic extensions (e.g. 'formPost'), looked up once per client.
+        if self._extensions is None:
+            res = self.request('getOpenSubsonicExtensions')
+            extensions = (res or {}).get('openSubsonicExtensions') or []
+            self._extensions = {extension.get('name') for extension in extensions}
+        return name in self._extensions
+
+    def close(self):
+        self.session.close()
+        self.write_session.close()
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_client(config):
+    base_url, username, password = config.get('navidrome_url'), config.get('navidrome_user'), config.get('navidrome_password')
     if not all([base_url, username, password]): return None
-    url = base_url.strip()
-    if not url.endswith('/'): url += '/'
-    if not url.endswith('/rest/'): url += 'rest/'
-    api_args = {'f': 'json', 'u': username, 'v': '1.16.1', 'c': 'PlaylistToolGUI'}
-    query = kwargs.pop('query', None)
-    api_args.update(kwargs)
-    salt = ''.join(random.choice(string.ascii_letters + string.digits) for _ in range(7))
-    token = md5((password + salt).encode('utf-8')).hexdigest()
-    api_args.update({'t': token, 's': salt})
-    full_url = url + endpoint + ".view"
-    params = api_args.copy()
-    if query: params['query'] = query
-    try:
-        res = requests.get(full_url, params=params, timeout=30)
-        res.raise_for_status()
-        res_json = res.json()
-        if 'subsonic-response' in res_json and res_json['subsonic-response'].get('status') == 'ok':
-            return res_json['subsonic-response']
-    except (requests.exceptions.RequestException, json.JSONDecodeError): return None
-    return None
-
-def get_all_songs_cache(config):
-    song_cache = {}
+    key = (base_url.strip(), username, password)
+    with _clients_lock:
+        client, pool_size = _clients.get(key), request_workers(config)
+        if client is None or client.pool_size != pool_size:
+            # The HTTP pools are sized when a client is made, so a new thread ceiling gets a new client (keeping
+            # the limiter's learned state); requests still running on the old one finish on its sessions.
+            if client is None: limiter = ConcurrencyLimiter(config.get('cache_workers', DEFAULT_CACHE_WORKERS), *_limiter_settings(config))
+            else: limiter = client.limiter; limiter.configure(*_limiter_settings(config))
+            client = _clients[key] = NavidromeClient(base_url, username, password, pool_size=pool_size, limiter=limiter)
+        elif client.limiter_settings != _limiter_settings(config): client.limiter.configure(*_limiter_settings(config))
+        client.limiter_settings = _limiter_settings(config)
+        return client
+
+def _limiter_settings(config):
+    return (config.get('max_concurrency', DEFAULT_MAX_CONCURRENCY) if config.get('adaptive_concurrency', True) else config.get('cache_workers', DEFAULT_CACHE_WORKERS),
+            config.get('max_requests_per_second', 0), config.get('adaptive_concurrency', True))
+
+def request_workers(config, max_workers=None):
+    # Threads for network fan-out. With adaptive concurrency there are enough threads for the limiter's
+    # ceiling and the limiter decides how many of them actually talk to the server at once.
+    if max_workers is not None: return max(1, int(max_workers))
+    if config.get('adaptive_concurrency', True): return max(1, int(config.get('max_concurrency', DEFAULT_MAX_CONCURRENCY)))
+    return max(1, int(config.get('cache_workers', DEFAULT_CACHE_WORKERS)))
+
+def api_request(config, endpoint, **kwargs):
+    client = get_client(config)
+    return client.request(endpoint, **kwargs) if client else None
+
+def send_api_request(base_url, username, password, endpoint, **kwargs):
+    return api_request({'navidrome_url': base_url, 'navidrome_user': username, 'navidrome_password': password}, endpoint, **kwargs)
+
+def _fetch_album_songs(config, album_id):
+    # None when the request failed, so the album can be retried; [] for an album without songs.
+    album_detail_res = api_request(config, 'getAlbum', id=album_id)
+    if not album_detail_res or 'album' not in album_detail_res: return None
+    if 'song' not in album_detail_res['album']: return []
+    songs = album_detail_res['album']['song']
+    if isinstance(songs, dict): songs = [songs]
+    return [Song.from_subsonic(song) for song in songs if 'path' in song and 'id' in song]
+
+def get_all_albums(config):
+    all_albums = []
     offset = 0
     PAGE_SIZE = 500
     while True:
-        album_list_res = send_api_request(
-            config['navidrome_url'], config['navidrome_user'], config['navidrome_password'], 
-            'getAlbumList2', type='alphabeticalByName', size=PAGE_SIZE, offset=offset
+        album_list_res = api_request(
+            config, 'getAlbumList2', type='alphabeticalByName', size=PAGE_SIZE, offset=offset
         )
-        if not album_list_res or 'albumList2' not in album_list_res or 'album' not in album_list_res['albumList2']:
+        # A failed page must not look like the end of the list, or a refresh would drop real albums.
+        if not album_list_res: return None
+        if 'albumList2' not in album_list_res or 'album' not in album_list_res['albumList2']:
             if offset == 0: return None 
             break
         albums = album_list_res['albumList2']['album']
         if isinstance(albums, dict): albums = [albums]
-        for album in albums:
-            album_detail_res = send_api_request(config['navidrome_url'], config['navidrome_user'], config['navidrome_password'], 'getAlbum', id=album['id'])
-            if album_detail_res and 'album' in album_detail_res and 'song' in album_detail_res['album']:
-                songs = album_detail_res['album']['song']
-                if isinstance(songs, dict): songs = [songs]
-                for song in songs:
-                    if 'path' in song and 'id' in song:
-                        normalized_path = song['path'].replace('\\', '/')
-                        song_cache[normalized_path] = song
+        all_albums.extend(albums)
         if len(albums) < PAGE_SIZE: break
         offset += PAGE_SIZE
-    return song_cache
+    return all_albums
 
-def download_all_playlists(config):
-    output_dir = config.get('navidrome_playlists_path')
-    if not output_dir: return 0, 0, "Navidrome playlists path not set in config."
-    playlists_res = send_api_request(config['navidrome_url'], config['navidrome_user'], config['navidrome_password'], 'getPlaylists')
-    if not playlists_res or 'playlists' not in playlists_res or 'playlist' not in playlists_res['playlists']:
-        return 0, 0, "Could not fetch playlist list from Navidrome."
-    playlists = playlists_res['playlists']['playlist']
-    total_count, success_count = len(playlists), 0
-    for playlist in playlists:
-        tracks_res = send_api_request(config['navidrome_url'], config['navidrome_user'], config['navidrome_password'], 'getPlaylist', id=playlist['id'])
-        if tracks_res and 'playlist' in tracks_res and 'entry' in tracks_res['playlist']:
-            filepath = os.path.join(output_dir, sanitize_filename(playlist['name']) + ".m3u")
+ALBUM_RETRY_ROUNDS = 2
+ALBUM_RETRY_DELAY = 2.0
+
+class BuildCancelled(Exception):
+    # Raised inside a cache build once its cancel_event is set; refresh_songs_cache turns it into a None result.
+    pass
+
+def _check_cancelled(cancel_event):
+    if cancel_event is not None and cancel_event.is_set(): raise BuildCancelled()
+
+def _fetch_albums_unordered(config, albums, indexes, max_workers, cancel_event=None):
+    if max_workers == 1:
+        for i in indexes:
+            _check_cancelled(cancel_event)
+            yield i, _fetch_album_songs(config, albums[i]['id'])
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(_fetch_album_songs, config, albums[i]['id']): i for i in indexes}
             try:
-                with open(filepath, 'w', encoding='utf-8') as f:
-                    f.write("#EXTM3U\n")
-                    for track in tracks_res['playlist']['entry']:
-                        if track.get('path'): f.write(track['path'] + "\n")
-                success_count += 1
-            except IOError: continue
-    return success_count, total_count, ""
-
-def parse_m3u(file_path):
-    tracks = []
+                for future in as_completed(futures):
+                    _check_cancelled(cancel_event)
+                    yield futures[future], future.result()
+            finally:
+                # Only the requests already in flight are waited for when the build stops early.
+                for future in futures: future.cancel()
+
+def _fetch_albums_songs(config, albums, max_workers=None, progress_callback=None, checkpoint=None, cancel_event=None):
+    # Returns the songs of each album in album order. Albums whose request failed are queued and retried
+    # up to ALBUM_RETRY_ROUNDS more times, with fewer workers and a pause; any still failing stay None.
+    max_workers = request_workers(config, max_workers)
+    album_songs = checkpoint.restore(albums) if checkpoint else [None] * len(albums)
+    pending = [i for i, songs in enumerate(album_songs) if songs is None]
+    done_count = len(albums) - len(pending)
+    for attempt in range(ALBUM_RETRY_ROUNDS + 1):
+        if not pending: break
+        if attempt:
+            if cancel_event is not None: cancel_event.wait(ALBUM_RETRY_DELAY * attempt)
+            else: time.sleep(ALBUM_RETRY_DELAY * attempt)
+        for i, songs in _fetch_albums_unordered(config, albums, pending, max(1, max_workers >> attempt), cancel_event):
+            if songs is None: continue
+            album_songs[i] = songs
+            done_count += 1
+            if checkpoint: checkpoint.add(albums[i], songs)
+            if progress_callback: progress_callback(done_count, len(albums))
+        pending = [i for i in pending if album_songs[i] is None]
+    return album_songs
+
+def _add_songs_to_cache(song_cache, album_songs):
+    for songs in album_songs:
+        for song in songs or ():
+            if 'path' in song and 'id' in song:
+                if not isinstance(song, Song): song = Song.from_subsonic(song)
+                normalized_path = song['path'].replace('\\', '/')
+                normalized_song_fields(song)
+                song_cache[normalized_path] = song
+
+SEARCH_PAGE_SIZE = 500
+
+def _fetch_song_page(config, offset):
+    res = api_request(config, 'search3', query='', songCount=SEARCH_PAGE_SIZE, songOffset=offset, artistCount=0, albumCount=0)
+    if not res or 'searchResult3' not in res: return None
+    songs = res['searchResult3'].get('song', [])
+    if isinstance(songs, dict): songs = [songs]
+    return [Song.from_subsonic(song) for song in songs if 'path' in song and 'id' in song]
+
+def _fetch_songs_by_search(config, max_workers=None, progress_callback=None, cancel_event=None):
+    # Pages through every song with an empty search3 query (OpenSubsonic, Navidrome), max_workers
+    # pages at a time. Returns the pages in offset order, or None when the server does not page the
+    # whole library that way: a failed or empty first page, or a short page followed by more songs.
+    max_workers = request_workers(config, max_workers)
+    pages, finished = [], False
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while not finished:
+            _check_cancelled(cancel_event)
+            offsets = [(len(pages) + i) * SEARCH_PAGE_SIZE for i in range(max_workers)]
+            for page in executor.map(lambda offset: _fetch_song_page(config, offset), offsets):
+                if page is None: return None
+                if finished and page: return None
+                if not page: finished = True
+                else:
+                    pages.append(page)
+                    if len(page) < SEARCH_PAGE_SIZE: finished = True
+            if progress_callback: progress_callback(len(pages), len(pages) + (0 if finished else max_workers))
+    return pages or None
+
+def _fetch_library_songs(config, albums, max_workers=None, progress_callback=None, strategy=None, checkpoint=None, cancel_event=None):
+    # 'search' pages songs straight from search3 (a few hundred requests instead of one per album) and
+    # falls back to the album walk when the server cannot do that; 'albums' always walks the albums.
+    if strategy is None: strategy = config.get('cache_strategy', 'albums')
+    if strategy == 'search':
+        pages = _fetch_songs_by_search(config, max_workers, progress_callback, cancel_event)
+        if pages is not None: return pages, False
+    return _fetch_albums_songs(config, albums, max_workers, progress_callback, checkpoint, cancel_event), True
+
+def _album_label(album):
+    return f"{album.get('artist') or 'Unknown Artist'} - {album.get('name') or album['id']}"
+
+def _build_full_cache(config, albums, max_workers=None, progress_callback=None, strategy=None, checkpoint_file=None, cancel_event=None):
+    # Returns (song_cache, report). The checkpoint is dropped once the build runs to the end and kept
+    # when it is cancelled or fails; albums that failed every retry are listed in the report instead.
+    checkpoint = BuildCheckpoint(checkpoint_file) if checkpoint_file else None
+    try: song_lists, by_album = _fetch_library_songs(config, albums, max_workers, progress_callback, strategy, checkpoint, cancel_event)
+    except BaseException:
+        if checkpoint: checkpoint.close()
+        raise
+    if checkpoint: checkpoint.discard()
+    # search3 pages are not per album; they only come back when the whole library was paged.
+    failed = [album for album, songs in zip(albums, song_lists) if songs is None] if by_album else []
+    resumed = checkpoint.resumed if checkpoint else 0
+    song_cache = {}
+    _add_songs_to_cache(song_cache, song_lists)
+    report = {'expected': len(albums), 'fetched': len(albums) - len(failed) - resumed, 'resumed': resumed, 'failed': len(failed),
+              'failed_albums': [_album_label(album) for album in failed], 'failed_ids': [album['id'] for album in failed]}
+    return song_cache, report
+
+@diagnostics.instrumented('cache.build')
+def get_all_songs_cache(config, max_workers=None, progress_callback=None, strategy=None, checkpoint_file=None, report=None):
+    # Album details (or search3 pages) are fetched concurrently but merged in album (or offset) order,
+    # so the result is the same path-keyed dict the sequential walk would produce. Pass a dict as
+    # report to receive the completeness report (albums expected/fetched/resumed/failed).
+    albums = get_all_albums(config)
+    if albums is None: return None
+    song_cache, build_report = _build_full_cache(config, albums, max_workers, progress_callback, strategy, checkpoint_file)
+    if report is not None: report.update(build_report)
+    return song_cache
+
+class BuildCheckpoint:
+    # Albums already fetched by a full cache build, saved as they arrive so that an interrupted build
+    # resumes where it stopped. Albums whose stamp changed since are fetched again.
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS albums (id TEXT PRIMARY KEY, stamp TEXT NOT NULL);
+    CREATE TABLE IF NOT EXISTS songs (album_key TEXT NOT NULL, id TEXT NOT NULL, path TEXT NOT NULL, title TEXT, artist TEXT, album TEXT,
+                                      album_id TEXT, duration INTEGER);
+    """
+    COMMIT_SECONDS = 2.0
+
+    def __init__(self, checkpoint_file):
+        self.checkpoint_file = checkpoint_file
+        self.resumed = 0
+        try:
+            self.conn = sqlite3.connect(checkpoint_file)
+            self.conn.executescript(self.SCHEMA)
+        except sqlite3.DatabaseError:
+            # An unreadable checkpoint is worth nothing; start over with a fresh one.
+            self.conn.close()
+            os.remove(checkpoint_file)
+            self.conn = sqlite3.connect(checkpoint_file)
+            self.conn.executescript(self.SCHEMA)
+        self._last_commit = time.monotonic()
+
+    def restore(self, albums):
+        # Songs per album for albums saved with their current stamp, None for the rest.
+        stamps = dict(self.conn.execute('SELECT id, stamp FROM albums'))
+        songs_by_album = defaultdict(list)
+        for album_key, *fields in self.conn.execute('SELECT album_key, id, path, title, artist, album, album_id, duration FROM songs ORDER BY rowid'):
+            songs_by_album[album_key].append(Song(*fields))
+        album_songs = []
+        for album in albums:
+            if stamps.get(album['id']) == _album_stamp(album): album_songs.append(songs_by_album.get(album['id'], []))
+            else: album_songs.append(None)
+        self.resumed = sum(1 for songs in album_songs if songs is not None)
+        return album_songs
+
+    def add(self, album, songs):
+        self.conn.execute('DELETE FROM songs WHERE album_key = ?', (album['id'],))
+        self.conn.execute('INSERT OR REPLACE INTO albums VALUES (?, ?)', (album['id'], _album_stamp(album)))
+        self.conn.executemany('INSERT INTO songs VALUES (?, ?, ?, ?, ?, ?, ?, ?)', (
+            (album['id'], song['id'], song['path'], song.get('title'), song.get('artist'), song.get('album'), song.get('albumId'),
+             song.get('duration')) for song in songs))
+        if time.monotonic() - self._last_commit >= self.COMMIT_SECONDS:
+            self.conn.commit()
+            self._last_commit = time.monotonic()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+    def discard(self):
+        self.conn.close()
+        try: os.remove(self.checkpoint_file)
+        except OSError: pass
+
+# On-disk song cache: a SQLite file holding only what matching and uploading read, written to a
+# temporary file and renamed into place so an interrupted save never leaves a half-written cache.
+SONG_CACHE_SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE songs (path TEXT NOT NULL, id TEXT NOT NULL, title TEXT, artist TEXT, album TEXT, album_id TEXT, duration INTEGER,
+                    norm_title TEXT, norm_album TEXT, norm_artist TEXT);
+"""
+SONG_CACHE_FORMAT = 1
+
+def _write_sqlite_file(target_file, schema, fill):
+    # Builds a fresh database next to target_file and swaps it in, so readers never see a half-written file.
+    fd, tmp_path = tempfile.mkstemp(prefix='.' + os.path.splitext(os.path.basename(target_file))[0] + '-', suffix='.tmp',
+                                    dir=os.path.dirname(os.path.abspath(target_file)))
+    os.close(fd)
+    try:
+        conn = sqlite3.connect(tmp_path)
+        try:
+            conn.execute('PRAGMA journal_mode=OFF')
+            conn.executescript(schema)
+            with conn: fill(conn)
+        finally:
+            conn.close()
+        os.replace(tmp_path, target_file)
+    except BaseException:
+        try: os.remove(tmp_path)
+        except OSError: pass
+        raise
+
+@diagnostics.instrumented('cache.save')
+def save_song_cache(cache_file, song_cache, sync_state=None):
+    def fill(conn):
+        conn.executemany('INSERT INTO meta VALUES (?, ?)', [('format', str(SONG_CACHE_FORMAT)), ('sync_state', json.dumps(sync_state or {}))])
+        conn.executemany('INSERT INTO songs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', (
+            (song['path'], song['id'], song.get('title'), song.get('artist'), song.get('album'), song.get('albumId') or song.get('parent'),
+             song.get('duration'), *normalized_song_fields(song)) for song in song_cache.values()))
+    _write_sqlite_file(cache_file, SONG_CACHE_SCHEMA, fill)
+
+@diagnostics.instrumented('cache.load')
+def load_song_cache(cache_file, legacy_json_file=None):
+    # Returns (song_cache, sync_state); (None, None) when there is no usable cache.
+    if not os.path.exists(cache_file):
+        return _load_legacy_song_cache(legacy_json_file) if legacy_json_file else (None, None)
     try:
-        with open(file_path, 'r', encoding='utf-8') as f: lines = f.readlines()
-    except Exception: return []
-    for line in lines:
-        line = line.strip()
-        if not line or line.startswith('#EXTM3U'): continue
-        normalized_line = line.replace('\\', '/')
-        parts = normalized_line.split('/')
-        if len(parts) >= 3:
+        conn = sqlite3.connect(cache_file)
+        try:
+            meta = dict(conn.execute('SELECT key, value FROM meta'))
+            if meta.get('format') != str(SONG_CACHE_FORMAT): return None, None
+            rows = conn.execute('SELECT path, id, title, artist, album, album_id, duration, norm_title, norm_album, norm_artist FROM songs ORDER BY rowid')
+            # Hundreds of thousands of Song objects, each with a tuple of normalized fields, all tracked by the
+            # cyclic GC even though they are slotted: pausing it roughly halves the load time.
+            gc_was_enabled = gc.isenabled()
+            gc.disable()
             try:
-                artist, filename = parts[0], parts[-1]
-                album = '/'.join(parts[1:-1])
-                raw_title = os.path.splitext(filename)[0]
-                cleaned_title = re.sub(r'^\s*\d+\s*[-._]?\s*', '', raw_title)
-                tracks.append({'artist': artist.strip(), 'album': album.strip(), 'title': cleaned_title.strip(), 'path': line})
-            except IndexError: continue
-    return tracks
+                song_cache = {path.replace('\\', '/'): Song(song_id, path, title, artist, album, album_id, duration, (norm_title, norm_album, norm_artist))
+                          for path, song_id, title, artist, album, album_id, duration, norm_title, norm_album, norm_artist in rows}
+            finally:
+                if gc_was_enabled: gc.enable()
+        finally:
+            conn.close()
+        return song_cache or None, json.loads(meta.get('sync_state') or '{}')
+    except (sqlite3.DatabaseError, json.JSONDecodeError): return None, None
 
-def merge_playlists(tracks1, tracks2):
-    merged = []
+def _load_legacy_song_cache(json_file):
+    try:
+        with open(json_file, 'r', encoding='utf-8') as f: data = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError): return None, None
+    # Older cache files are a bare path->song dict without a sync watermark.
+    sync_state = None
+    if isinstance(data, dict) and 'songs' in data and 'sync_state' in data: data, sync_state = data['songs'], data['sync_state']
+    if not isinstance(data, dict): return None, None
+    return {path: Song.from_subsonic(song) for path, song in data.items() if 'path' in song and 'id' in song}, sync_state
+
+def song_cache_version(sync_state):
+    # Identifies the song cache contents by its album stamps; None when the cache has no sync state.
+    albums = (sync_state or {}).get('albums')
+    if not albums: return None
+    return md5(json.dumps(sorted(albums.items())).encode('utf-8')).hexdigest()
+
+def _album_stamp(album):
+    # Navidrome reports 'changed' on newer versions; song count and duration catch edits on older ones.
+    return f"{album.get('changed') or album.get('created', '')}|{album.get('songCount', '')}|{album.get('duration', '')}"
+
+def _get_library_last_modified(config, since=0):
+    res = api_request(config, 'getIndexes', ifModifiedSince=since)
+    if not res or 'indexes' not in res: return None
+    return res['indexes'].get('lastModified')
+
+@diagnostics.instrumented('cache.refresh')
+def refresh_songs_cache(config, song_cache=None, sync_state=None, max_workers=None, progress_callback=None, strategy=None, checkpoint_file=None,
+                        cancel_event=None):
+    # Re-fetches only albums added or changed since sync_state and drops songs of albums that
+    # disappeared; without a previous cache or sync state this is a (checkpointed) full build.
+    # Albums that could not be fetched are left out of the new sync state, so the next refresh
+    # retries them, and are listed in the summary ('failed', 'failed_albums'). Setting cancel_event
+    # stops the build with a (None, None, None) result; a full build resumes from its checkpoint later.
+    try: return _refresh_songs_cache(config, song_cache, sync_state, max_workers, progress_callback, strategy, checkpoint_file, cancel_event)
+    except BuildCancelled: return None, None, None
+
+def _refresh_songs_cache(config, song_cache, sync_state, max_workers, progress_callback, strategy, checkpoint_file, cancel_event):
+    incremental = bool(song_cache) and bool(sync_state and sync_state.get('albums'))
+    previous_modified = sync_state.get('library_last_modified') if incremental else None
+    last_modified = _get_library_last_modified(config, previous_modified or 0)
+    summary = {'full': not incremental, 'added': 0, 'changed': 0, 'removed': 0, 'albums': 0,
+               'expected': 0, 'fetched': 0, 'resumed': 0, 'failed': 0, 'failed_albums': []}
+    if incremental and previous_modified and last_modified is not None and last_modified <= previous_modified and not sync_state.get('incomplete'):
+        summary['albums'] = len(sync_state['albums'])
+        return song_cache, dict(sync_state, last_sync=time.time()), summary
+    albums = get_all_albums(config)
+    if albums is None: return None, None, None
+    summary['albums'] = len(albums)
+    new_albums = {album['id']: _album_stamp(album) for album in albums}
+    new_state = {'last_sync': time.time(), 'library_last_modified': last_modified, 'albums': new_albums}
+    if not incremental:
+        song_cache, report = _build_full_cache(config, albums, max_workers, progress_callback, strategy, checkpoint_file, cancel_event)
+        failed_ids = report.pop('failed_ids')
+        for album_id in failed_ids: del new_albums[album_id]
+        if failed_ids: new_state['incomplete'] = True
+        summary.update(report, added=len(albums) - len(failed_ids))
+        return song_cache, new_state, summary
+    old_albums = sync_state['albums']
+    to_fetch = [album for album in albums if old_albums.get(album['id']) != new_albums[album['id']]]
+    summary['added'] = sum(1 for album in to_fetch if album['id'] not in old_albums)
+    summary['changed'] = len(to_fetch) - summary['added']
+    summary['removed'] = len(old_albums.keys() - new_albums.keys())
+    album_songs = _fetch_albums_songs(config, to_fetch, max_workers, progress_callback, cancel_event=cancel_event)
+    # A changed album that failed keeps its old songs and stamp; a new one stays out of the state.
+    failed = [album for album, songs in zip(to_fetch, album_songs) if songs is None]
+    for album in failed:
+        if album['id'] in old_albums: new_albums[album['id']] = old_albums[album['id']]
+        else: del new_albums[album['id']]
+    if failed: new_state['incomplete'] = True
+    stale_ids = {album['id'] for album, songs in zip(to_fetch, album_songs) if songs is not None and album['id'] in old_albums}
+    stale_ids |= old_albums.keys() - new_albums.keys()
+    song_cache = {path: song for path, song in song_cache.items() if (song.get('albumId') or song.get('parent')) not in stale_ids}
+    _add_songs_to_cache(song_cache, album_songs)
+    summary.update(expected=len(to_fetch), fetched=len(to_fetch) - len(failed), failed=len(failed), failed_albums=[_album_label(album) for album in failed])
+    return song_cache, new_state, summary
+
+SYNC_MANIFEST_FILE = ".navidrome_sync.json"
+
+def get_server_playlists(config):
+    playlists_res = api_request(config, 'getPlaylists')
+    if not playlists_res or 'playlists' not in playlists_res: return None
+    playlists = playlists_res['playlists'].get('playlist', [])
+    return [playlists] if isinstance(playlists, dict) else playlists
+
+def _load_sync_manifest(output_dir):
+    try:
+        with open(os.path.join(output_dir, SYNC_MANIFEST_FILE), 'r', encoding='utf-8') as f: return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError): return {}
+
+def _save_sync_manifest(output_dir, manifest):
+    manifest_path = os.path.join(output_dir, SYNC_MANIFEST_FILE)
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f: json.dump(manifest, f, indent=1)
+    os.replace(tmp_path, manifest_path)
+
+def _file_signature(file_path):
+    # [mtime_ns, size] of a synced file, as stored in the manifest; None when it is gone.
+    try: stat = os.stat(file_path)
+    except OSError: return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+def _download_playlist(config, output_dir, playlist):
+    # Returns 'written', 'unchanged' or 'failed'.
+    tracks_res = api_request(config, 'getPlaylist', id=playlist['id'])
+    if not tracks_res or 'playlist' not in tracks_res: return 'failed'
+    # Subsonic leaves 'entry' out of an empty playlist; that is a valid, empty download.
+    entries = tracks_res['playlist'].get('entry', [])
+    if isinstance(entries, dict): entries = [entries]
+    content = "#EXTM3U\n" + "".join(track['path'] + "\n" for track in entries if track.get('path'))
+    filepath = os.path.join(output_dir, sanitize_filename(playlist['name']) + ".m3u")
+    try:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            if f.read() == content: return 'unchanged'
+    except (IOError, UnicodeDecodeError): pass
+    try:
+        with open(filepath, 'w', encoding='utf-8') as f: f.write(content)
+    except IOError: return 'failed'
+    return 'written'
+
+@diagnostics.instrumented('sync.playlists')
+def sync_playlists(config, max_workers=None):
+    # Downloads only playlists whose 'changed'/'songCount' differ from the local manifest, or whose file is gone or
+    # was changed locally since it was synced (Add and Merge write into this folder), fetching them concurrently. Returns a summary dict; 'error' is set if the playlist list could not be read.
+    summary = {'total': 0, 'written': 0, 'unchanged': 0, 'skipped': 0, 'failed': 0, 'error': ""}
+    output_dir = config.get('navidrome_playlists_path')
+    if not output_dir:
+        summary['error'] = "Navidrome playlists path not set in config."; return summary
+    playlists = get_server_playlists(config)
+    if playlists is None:
+        summary['error'] = "Could not fetch playlist list from Navidrome."; return summary
+    summary['total'] = len(playlists)
+    manifest = _load_sync_manifest(output_dir)
+    new_manifest, to_download = {}, []
+    for playlist in playlists:
+        stamp = {'name': playlist['name'], 'changed': playlist.get('changed'), 'songCount': playlist.get('songCount')}
+        filepath = os.path.join(output_dir, sanitize_filename(playlist['name']) + ".m3u")
+        file_signature = _file_signature(filepath)
+        if manifest.get(playlist['id']) == dict(stamp, file=file_signature) and stamp['changed'] and file_signature:
+            new_manifest[playlist['id']] = manifest[playlist['id']]
+            summary['skipped'] += 1
+        else: to_download.append((playlist, stamp))
+    if to_download:
+        with ThreadPoolExecutor(max_workers=request_workers(config, max_workers)) as executor:
+            outcomes = executor.map(lambda item: _download_playlist(config, output_dir, item[0]), to_download)
+            for (playlist, stamp), outcome in zip(to_download, outcomes):
+                summary[outcome] += 1
+                filepath = os.path.join(output_dir, sanitize_filename(playlist['name']) + ".m3u")
+                if outcome != 'failed': new_manifest[playlist['id']] = dict(stamp, file=_file_signature(filepath))
+    try: _save_sync_manifest(output_dir, new_manifest)
+    except IOError: pass
+    return summary
+
+def download_all_playlists(config):
+    summary = sync_playlists(config)
+    if summary['error']: return 0, 0, summary['error']
+    return summary['written'] + summary['unchanged'] + summary['skipped'], summary['total'], ""
+
+TRACK_NUMBER_RE = re.compile(r'^\s*\d+\s*[-._]?\s*')
+
+def _parse_extinf(line):
+    # "#EXTINF:213,Artist - Title" -> (213, "Artist - Title"); a missing or negative duration becomes None.
+    duration, _, title = line[len('#EXTINF:'):].partition(',')
+    try: duration = int(float(duration.split()[0])) if duration.strip() else None
+    except ValueError: duration = None
+    if duration is not None and duration < 0: duration = None
+    return duration, title.strip()
+
+def iter_m3u(file_path, extended=False):
+    # Yields tracks one line at a time. With extended=True, '#' directives are skipped instead of being
+    # parsed as paths and each track carries the 'duration' and 'extinf_title' of the #EXTINF line before it.
+    try: f = open(file_path, 'r', encoding='utf-8')
+    except Exception: return
+    extinf = None
+    with f:
+        try:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith('#EXTM3U'): continue
+                if extended and line.startswith('#'):
+                    if line.startswith('#EXTINF:'): extinf = _parse_extinf(line)
+                    continue
+                normalized_line = line.replace('\\', '/')
+                parts = normalized_line.split('/')
+                if len(parts) >= 3:
+                    artist, filename = parts[0], parts[-1]
+                    album = '/'.join(parts[1:-1])
+                    raw_title = os.path.splitext(filename)[0]
+                    cleaned_title = TRACK_NUMBER_RE.sub('', raw_title)
+                    track = {'artist': artist.strip(), 'album': album.strip(), 'title': cleaned_title.strip(), 'path': line}
+                    if extended:
+                        track['duration'], track['extinf_title'] = extinf or (None, None)
+                    yield track
+                extinf = None
+        except (OSError, UnicodeDecodeError): return
+
+@diagnostics.instrumented('m3u.parse')
+def parse_m3u(file_path, extended=False):
+    return list(iter_m3u(file_path, extended))
+
+class ParsedPlaylistCache:
+    # Extended-mode parses of playlist files, reused until a file's mtime or size changes.
+    # Least recently used playlists are dropped once more than max_tracks tracks are held.
+    def __init__(self, max_tracks=200000):
+        self.max_tracks = max_tracks
+        self._entries = OrderedDict()
+        self._track_count = 0
+        self._lock = threading.Lock()
+
+    def get(self, file_path):
+        key = os.path.abspath(file_path)
+        try: stat = os.stat(key)
+        except OSError:
+            self.forget(key)
+            return []
+        signature = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == signature:
+                self._entries.move_to_end(key)
+                return entry[1]
+        tracks = parse_m3u(key, extended=True)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old: self._track_count -= len(old[1])
+            if len(tracks) <= self.max_tracks:
+                self._entries[key] = (signature, tracks)
+                self._track_count += len(tracks)
+            while self._track_count > self.max_tracks:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._track_count -= len(evicted)
+        return tracks
+
+    def forget(self, file_path):
+        with self._lock:
+            entry = self._entries.pop(os.path.abspath(file_path), None)
+            if entry: self._track_count -= len(entry[1])
+
+_playlist_cache = ParsedPlaylistCache()
+
+def load_playlist(file_path):
+    # Cached extended-mode parse of file_path, shared by every caller. The returned list must not be modified.
+    return _playlist_cache.get(file_path)
+
+def forget_playlist(file_path):
+    _playlist_cache.forget(file_path)
+
+class PlaylistFolderIndex:
+    # Sorted .m3u names per folder. A folder is only listed again when its own mtime changes,
+    # i.e. when a playlist was added, removed or renamed; scan() is cheap enough to poll.
+    def __init__(self):
+        self._folders = {}
+        self._lock = threading.Lock()
+
+    def scan(self, folder_path, force=False):
+        # Returns (names, changed); names is None when the folder does not exist.
+        try: mtime = os.stat(folder_path).st_mtime_ns
+        except OSError: mtime = None
+        with self._lock: cached = self._folders.get(folder_path)
+        if cached and cached[0] == mtime and not force: return cached[1], False
+        names = None
+        if mtime is not None:
+            try: names = sorted(f for f in os.listdir(folder_path) if f.lower().endswith('.m3u'))
+            except OSError: pass
+        with self._lock: self._folders[folder_path] = (mtime, names)
+        return names, cached is None or cached[1] != names
+
+    def names(self, folder_path):
+        return self.scan(folder_path)[0]
+
+def iter_merged_tracks(*track_iterables):
+    # Streams the tracks of every iterable in order, dropping repeated paths.
     seen_paths = set()
-    for track in tracks1 + tracks2:
-        if track['path'] not in seen_paths:
-            merged.append(track)
-            seen_paths.add(track['path'])
-    return merged
+    for tracks in track_iterables:
+        for track in tracks:
+            if track['path'] not in seen_paths:
+                seen_paths.add(track['path'])
+                yield track
+
+def merge_playlists(tracks1, tracks2):
+    return list(iter_merged_tracks(tracks1, tracks2))
+
+def write_m3u(file_path, tracks):
+    # tracks may be a lazy stream that still reads from file_path, so write beside it and swap in at the end.
+    # Returns (success, error message).
+    temp_path = file_path + '.tmp'
+    try:
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write("#EXTM3U\n")
+            for track in tracks:
+                if not track or not track.get('path'): continue
+                if track.get('extinf_title') is not None:
+                    duration = track.get('duration')
+                    f.write(f"#EXTINF:{-1 if duration is None else duration},{track['extinf_title']}\n")
+                f.write(f"{track['path']}\n")
+        os.replace(temp_path, file_path)
+        forget_playlist(file_path)
+        return True, ""
+    except Exception as e:
+        if os.path.exists(temp_path): os.remove(temp_path)
+        return False, str(e)
 
 def search_tracks(config, query, count=50):
-    if not query or not all(config.values()): return []
-    res = send_api_request(config['navidrome_url'], config['navidrome_user'], config['navidrome_password'], 'search3', query=query, songCount=count, artistCount=0, albumCount=0)
+    if not query or not all(config.get(key) for key in ('navidrome_url', 'navidrome_user', 'navidrome_password')): return []
+    res = api_request(config, 'search3', query=query, songCount=count, artistCount=0, albumCount=0)
     if res and res.get('searchResult3', {}).get('song'): 
         songs = res['searchResult3']['song']
         return songs if isinstance(songs, list) else [songs]
     return []
 
-def upload_playlist(config, playlist_filepath, song_cache):
-    if not os.path.exists(playlist_filepath): return False, "Playlist file not found."
-    playlist_name = os.path.splitext(os.path.basename(playlist_filepath))[0]
-    tracks_to_find = parse_m3u(playlist_filepath)
-    if not tracks_to_find: return False, "Playlist is empty or could not be read."
+def is_song_cache_stale(config, sync_state):
+    # Stale only when the server positively reports a library scan newer than the cache.
+    if not sync_state or not sync_state.get('library_last_modified'): return False
+    last_modified = _get_library_last_modified(config, sync_state['library_last_modified'])
+    return last_modified is not None and last_modified > sync_state['library_last_modified']
+
+# Offline stand-in for search3: an inverted index of normalized title/artist/album tokens over song_cache.
+DURATION_BUCKET = 5
+DURATION_TOLERANCE = 10
+DURATION_TOLERANCE_RATIO = 0.05
+
+def duration_tolerance(duration):
+    return max(DURATION_TOLERANCE, duration * DURATION_TOLERANCE_RATIO)
+
+def duration_matches(song, duration):
+    # Rejects candidates far from the playlist's #EXTINF length; songs or tracks without one always pass.
+    song_duration = song.get('duration')
+    return not duration or not song_duration or abs(song_duration - duration) <= duration_tolerance(duration)
+
+class SongIndex:
+    COMMON_TOKEN_POSTINGS = 2000
 
+    def __init__(self, song_cache, stale=False):
+        self.source = song_cache
+        self.stale = stale
+        self.songs = list(song_cache.values())
+        self.song_tokens = []
+        self.postings = defaultdict(list)
+        self.duration_buckets = defaultdict(list)
+        self.unknown_duration = []
+        for i, song in enumerate(self.songs):
+            tokens = frozenset(' '.join(normalized_song_fields(song)).split())
+            self.song_tokens.append(tokens)
+            for token in tokens: self.postings[token].append(i)
+            duration = song.get('duration')
+            if duration: self.duration_buckets[int(duration) // DURATION_BUCKET].append(i)
+            else: self.unknown_duration.append(i)
+        self.postings = dict(self.postings)
+        self.duration_buckets = dict(self.duration_buckets)
+
+    def songs_near_duration(self, duration):
+        # Indexes of the songs duration_matches() accepts, gathered from the neighbouring buckets only.
+        tolerance = duration_tolerance(duration)
+        nearby = set(self.unknown_duration)
+        for bucket in range(int(duration - tolerance) // DURATION_BUCKET, int(duration + tolerance) // DURATION_BUCKET + 1):
+            nearby.update(i for i in self.duration_buckets.get(bucket, ()) if abs(self.songs[i]['duration'] - duration) <= tolerance)
+        return nearby
+
+    def search(self, query, count=50, duration=None):
+        tokens = set(normalize_for_search(query).split())
+        postings = sorted(((token, self.postings[token]) for token in tokens if token in self.postings), key=lambda item: len(item[1]))
+        if not postings: return []
+        allowed = self.songs_near_duration(duration) if duration else None
+        scores = defaultdict(float)
+        total = len(self.songs)
+        for token, song_ids in postings:
+            weight = math.log(1 + total / len(song_ids))
+            if scores and len(song_ids) > self.COMMON_TOKEN_POSTINGS:
+                # Very common words only re-rank candidates the rarer words already found.
+                for i in scores:
+                    if token in self.song_tokens[i]: scores[i] += weight
+            elif allowed is None:
+                for i in song_ids: scores[i] += weight
+            else:
+                for i in song_ids:
+                    if i in allowed: scores[i] += weight
+        best = heapq.nlargest(count, scores.items(), key=lambda item: (item[1], -item[0]))
+        return [self.songs[i] for i, _ in best]
+
+class PathIndex:
+    # Looser lookups for playlist paths that miss the song cache by exact path, tried in order: same
+    # path in another Unicode form (NFC vs macOS NFD), any case, another extension (re-encoded files),
+    # and finally the longest shared path suffix (a different library root). Ambiguous keys map to None.
+    # A suffix must reach the artist folder: album/file alone ("Greatest Hits/01 - Intro") is shared by
+    # unrelated songs, and a loose hit is trusted as [FOUND] without any fuzzy check.
+    MIN_SUFFIX_PARTS = 3
+
+    def __init__(self, song_cache):
+        self.source = song_cache
+        self.nfc, self.folded, self.stems, self.suffixes = {}, {}, {}, {}
+        for path, song in song_cache.items():
+            nfc = unicodedata.normalize('NFC', path)
+            folded = nfc.casefold()
+            stem = os.path.splitext(folded)[0]
+            self._add(self.nfc, nfc, song)
+            self._add(self.folded, folded, song)
+            self._add(self.stems, stem, song)
+            parts = tuple(reversed(stem.split('/')))
+            for k in range(self.MIN_SUFFIX_PARTS, len(parts) + 1): self._add(self.suffixes, parts[:k], song)
+
+    @staticmethod
+    def _add(index, key, song):
+        if index.get(key, song) is not song: index[key] = None
+        else: index[key] = song
+
+    def lookup(self, path):
+        # path uses '/' separators; returns the song or None.
+        nfc = unicodedata.normalize('NFC', path)
+        folded = nfc.casefold()
+        stem = os.path.splitext(folded)[0]
+        for index, key in ((self.nfc, nfc), (self.folded, folded), (self.stems, stem)):
+            if key in index: return index[key]
+        parts = tuple(reversed(stem.split('/')))
+        for k in range(len(parts), self.MIN_SUFFIX_PARTS - 1, -1):
+            # Any shorter suffix of an ambiguous one is ambiguous too.
+            if parts[:k] in self.suffixes: return self.suffixes[parts[:k]]
+        return None
+
+_path_index, _path_index_lock = None, threading.Lock()
+
+def get_path_index(song_cache):
+    # Built once per song cache and shared by every caller.
+    global _path_index
+    with _path_index_lock:
+        if _path_index is None or _path_index.source is not song_cache: _path_index = PathIndex(song_cache)
+        return _path_index
+
+def find_cached_song(song_cache, path):
+    # Returns (song, exact); exact is False when the song was found through the PathIndex tiers.
+    normalized_path = path.replace('\\', '/')
+    song = song_cache.get(normalized_path)
+    if song: return song, True
+    return get_path_index(song_cache).lookup(normalized_path), False
+
+def get_server_playlist_ids(config):
+    playlists = get_server_playlists(config)
+    if playlists is None: return None
+    playlist_ids = {}
+    for playlist in playlists: playlist_ids.setdefault(playlist['name'], playlist['id'])
+    return playlist_ids
+
+MAX_URL_LENGTH = 4000
+
+def _chunk_for_url(client, endpoint, base_params, param_name, values):
+    # Splits values so that no GET request carrying them exceeds MAX_URL_LENGTH.
+    budget = MAX_URL_LENGTH - client.url_length(endpoint, **base_params)
+    chunk, chunk_length = [], 0
+    for value in values:
+        value_length = len(urlencode({param_name: value})) + 1
+        if chunk and chunk_length + value_length > budget:
+            yield chunk
+            chunk, chunk_length = [], 0
+        chunk.append(value)
+        chunk_length += value_length
+    if chunk: yield chunk
+
+def _send_list_param(config, endpoint, base_params, param_name, values):
+    # Sends one list-valued parameter, in a single POST body where the server supports it
+    # (OpenSubsonic formPost) and otherwise in URL-sized GET chunks. Returns the last response or None.
+    client = get_client(config)
+    if not client: return None
+    if client.supports_extension('formPost'):
+        return client.request(endpoint, http_method='POST', **base_params, **{param_name: list(values)})
+    res = None
+    for chunk in _chunk_for_url(client, endpoint, base_params, param_name, values):
+        res = client.request(endpoint, **base_params, **{param_name: chunk})
+        if res is None: return None
+    return res
+
+def _create_playlist(config, playlist_name, song_ids):
+    client = get_client(config)
+    if client and client.supports_extension('formPost'):
+        return _send_list_param(config, 'createPlaylist', {'name': playlist_name}, 'songId', song_ids) is not None
+    chunks = list(_chunk_for_url(client, 'createPlaylist', {'name': playlist_name}, 'songId', song_ids)) if client else []
+    if not chunks: return False
+    res = api_request(config, 'createPlaylist', name=playlist_name, songId=chunks[0])
+    if res is None: return False
+    if len(chunks) == 1: return True
+    # Subsonic before 1.14 answers createPlaylist without the new playlist, so look it up by name.
+    playlist_id = (res.get('playlist') or {}).get('id') or (get_server_playlist_ids(config) or {}).get(playlist_name)
+    if not playlist_id: return False
+    remaining = [song_id for chunk in chunks[1:] for song_id in chunk]
+    return _send_list_param(config, 'updatePlaylist', {'playlistId': playlist_id}, 'songIdToAdd', remaining) is not None
+
+def _update_playlist_delta(config, playlist_id, song_ids):
+    # Brings the server playlist to song_ids with updatePlaylist: keeps the longest prefix of song_ids
+    # that is already there in order, removes every other server entry and appends the rest.
+    # Returns (added, removed), or None on failure.
+    res = api_request(config, 'getPlaylist', id=playlist_id)
+    if not res or 'playlist' not in res: return None
+    entries = res['playlist'].get('entry', [])
+    if isinstance(entries, dict): entries = [entries]
+    kept, indexes_to_remove = 0, []
+    for index, entry in enumerate(entries):
+        if kept < len(song_ids) and entry['id'] == song_ids[kept]: kept += 1
+        else: indexes_to_remove.append(index)
+    ids_to_add = song_ids[kept:]
+    # Highest indexes go first so that earlier chunks never shift the positions of later ones.
+    if indexes_to_remove and _send_list_param(config, 'updatePlaylist', {'playlistId': playlist_id}, 'songIndexToRemove',
+                                              sorted(indexes_to_remove, reverse=True)) is None: return None
+    if ids_to_add and _send_list_param(config, 'updatePlaylist', {'playlistId': playlist_id}, 'songIdToAdd', ids_to_add) is None: return None
+    return len(ids_to_add), len(indexes_to_remove)
+
+@diagnostics.instrumented('upload.playlist')
+def _upload_playlist(config, playlist_filepath, song_cache, playlist_ids):
+    playlist_name = os.path.splitext(os.path.basename(playlist_filepath))[0]
+    result = {'name': playlist_name, 'success': False, 'action': None, 'uploaded': 0, 'missing': 0, 'added': 0, 'removed': 0, 'message': ""}
+    if not os.path.exists(playlist_filepath): return dict(result, message="Playlist file not found.")
     song_ids_to_upload, found_count, missing_count = [], 0, 0
-    for track in tracks_to_find:
+    for track in load_playlist(playlist_filepath):
         # --- FIX: Use the reliable cache lookup first ---
-        normalized_path = track['path'].replace('\\', '/')
-        song_object = song_cache.get(normalized_path)
+        song_object, _ = find_cached_song(song_cache, track['path'])
         
         if song_object:
             song_ids_to_upload.append(song_object['id'])
             found_count += 1
         else:
             missing_count += 1
+    if not found_count and not missing_count: return dict(result, message="Playlist is empty or could not be read.")
+    result.update(uploaded=found_count, missing=missing_count)
 
-    if not song_ids_to_upload: return False, f"Could not find any tracks on the server using the path cache."
+    if not song_ids_to_upload: return dict(result, message=f"Could not find any tracks on the server using the path cache.")
     
-    playlists_res = send_api_request(config['navidrome_url'], config['navidrome_user'], config['navidrome_password'], 'getPlaylists')
-    existing_playlist_id = None
-    if playlists_res and 'playlists' in playlists_res and 'playlist' in playlists_res['playlists']:
-        server_playlists = playlists_res['playlists']['playlist']
-        if isinstance(server_playlists, dict): server_playlists = [server_playlists]
-        for playlist in server_playlists:
-            if playlist['name'] == playlist_name:
-                existing_playlist_id = playlist['id']
-                break
-    upload_params = {'name': playlist_name, 'songId': song_ids_to_upload}
-    action_verb = "Created"
+    existing_playlist_id = playlist_ids.get(playlist_name)
     if existing_playlist_id:
-        upload_params['playlistId'] = existing_playlist_id
-        action_verb = "Updated"
-    upload_res = send_api_request(config['navidrome_url'], config['navidrome_user'], config['navidrome_password'], 'createPlaylist', **upload_params)
-    if upload_res:
-        summary = f"Successfully {action_verb} playlist '{playlist_name}'.\n\nTracks Uploaded: {found_count}\nTracks Not Found: {missing_count}"
-        return True, summary
+        changes = _update_playlist_delta(config, existing_playlist_id, song_ids_to_upload)
+        if changes is None: return dict(result, message=f"Failed to upload playlist '{playlist_name}' to Navidrome.")
+        added, removed = changes
+        summary = (f"Successfully Updated playlist '{playlist_name}'.\n\nTracks Uploaded: {found_count}\nTracks Not Found: {missing_count}\n"
+                   f"Changes on server: {added} added, {removed} removed")
+        return dict(result, success=True, action='updated', added=added, removed=removed, message=summary)
+    if _create_playlist(config, playlist_name, song_ids_to_upload):
+        summary = f"Successfully Created playlist '{playlist_name}'.\n\nTracks Uploaded: {found_count}\nTracks Not Found: {missing_count}"
+        return dict(result, success=True, action='created', added=len(song_ids_to_upload), message=summary)
     else:
-        return False, f"Failed to upload playlist '{playlist_name}' to Navidrome."
+        return dict(result, message=f"Failed to upload playlist '{playlist_name}' to Navidrome.")
+
+def upload_playlist(config, playlist_filepath, song_cache, playlist_ids=None):
+    if playlist_ids is None: playlist_ids = get_server_playlist_ids(config) or {}
+    result = _upload_playlist(config, playlist_filepath, song_cache, playlist_ids)
+    return result['success'], result['message']
+
+def upload_all_playlists(config, folder, song_cache, max_workers=None):
+    # Uploads every .m3u in folder concurrently after a single getPlaylists lookup.
+    # Returns (results, error): one result dict per playlist, sorted by name.
+    playlist_ids = get_server_playlist_ids(config)
+    if playlist_ids is None: return [], "Could not fetch playlist list from Navidrome."
+    try: playlist_files = sorted(f for f in os.listdir(folder) if f.lower().endswith('.m3u'))
+    except FileNotFoundError: return [], "Playlist folder not found."
+    with ThreadPoolExecutor(max_workers=request_workers(config, max_workers)) as executor:
+        results = list(executor.map(lambda f: _upload_playlist(config, os.path.join(folder, f), song_cache, playlist_ids), playlist_files))
+    return results, ""
+
+def _batch_ratio(queries, choices):
+    # Element-wise fuzz.ratio over two aligned lists, rounded the way thefuzz rounds.
+    if not queries: return []
+    if _cpdist is not None:
+        return numpy.rint(_cpdist(queries, choices, scorer=_rf_ratio, dtype=numpy.float64, workers=-1)).astype(int).tolist()
+    return [fuzz.ratio(query, choice) for query, choice in zip(queries, choices)]
+
+@diagnostics.instrumented('match.score')
+def score_candidates(queries, candidate_lists, title_only=False):
+    # Scores every (track, candidate) pair in one batch and returns (best_song, best_score) per track.
+    # queries hold normalized [title, album, artist]; the first highest-scoring candidate wins, as before.
+    field_count = 1 if title_only else 3
+    pair_queries, pair_choices = [[] for _ in range(field_count)], [[] for _ in range(field_count)]
+    for query, candidates in zip(queries, candidate_lists):
+        candidate_fields = [normalized_song_fields(song) for song in candidates]
+        for f in range(field_count):
+            pair_queries[f].extend([query[f]] * len(candidates))
+            pair_choices[f].extend(fields[f] for fields in candidate_fields)
+    field_scores = [_batch_ratio(pair_queries[f], pair_choices[f]) for f in range(field_count)]
+    if title_only: pair_scores = field_scores[0]
+    else: pair_scores = [(title * 0.6) + (album * 0.3) + (artist * 0.1) for title, album, artist in zip(*field_scores)]
+    best, pos = [], 0
+    for candidates in candidate_lists:
+        best_candidate, highest_score = None, 0
+        for song in candidates:
+            if pair_scores[pos] > highest_score: highest_score, best_candidate = pair_scores[pos], song
+            pos += 1
+        best.append((best_candidate, highest_score))
+    return best
 
-def run_playlist_check(config, local_tracks, song_cache):
+MATCH_CACHE_SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE matches (path TEXT PRIMARY KEY, version TEXT, song_id TEXT, status TEXT NOT NULL, score REAL NOT NULL, decided INTEGER NOT NULL);
+"""
+MATCH_CACHE_FORMAT = 1
+
+class MatchCache:
+    # Check results remembered per playlist track path. Automatic matches are only reused for the
+    # song-cache version they were made against; user decisions (Accept/Replace/toggle) are kept
+    # for as long as the chosen song is still in the song cache. Safe to share between check workers.
+    def __init__(self, entries=None):
+        self.entries = entries or {}  # path -> (version, song_id, status, score, decided)
+        self.dirty = False
+        self._songs_by_id, self._songs_source = {}, None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(track):
+        return track['path'].replace('\\', '/')
+
+    def _song_lookup(self, song_cache):
+        with self._lock:
+            if self._songs_source is not song_cache:
+                self._songs_by_id = {song['id']: song for song in song_cache.values()}
+                self._songs_source = song_cache
+            return self._songs_by_id
+
+    def lookup(self, track, song_cache, version, decided_only=False):
+        # Returns a check result for track, or None when it has to be matched again.
+        entry = self.entries.get(self.key(track))
+        if entry is None: return None
+        entry_version, song_id, status, score, decided = entry
+        if decided_only and not decided: return None
+        if not decided and (version is None or entry_version != version): return None
+        song = self._song_lookup(song_cache).get(song_id) if song_id else None
+        if song_id and song is None: return None
+        return {'original_track': track, 'navidrome_song': song, 'status': status, 'score': score}
+
+    def remember(self, item, version, decided=False):
+        song = item['navidrome_song']
+        with self._lock:
+            self.entries[self.key(item['original_track'])] = (version, song['id'] if song else None, item['status'], item['score'], decided)
+            self.dirty = True
+
+def save_match_cache(cache_file, match_cache, version=None):
+    # Automatic matches made against another song-cache version can never be reused, so they are dropped.
+    with match_cache._lock:
+        rows = [(path,) + entry for path, entry in match_cache.entries.items() if entry[4] or entry[0] == version]
+        match_cache.dirty = False
+    def fill(conn):
+        conn.execute('INSERT INTO meta VALUES (?, ?)', ('format', str(MATCH_CACHE_FORMAT)))
+        conn.executemany('INSERT INTO matches VALUES (?, ?, ?, ?, ?, ?)', rows)
+    _write_sqlite_file(cache_file, MATCH_CACHE_SCHEMA, fill)
+
+def load_match_cache(cache_file):
+    if not os.path.exists(cache_file): return MatchCache()
+    try:
+        conn = sqlite3.connect(cache_file)
+        try:
+            meta = dict(conn.execute('SELECT key, value FROM meta'))
+            if meta.get('format') != str(MATCH_CACHE_FORMAT): return MatchCache()
+            rows = conn.execute('SELECT path, version, song_id, status, score, decided FROM matches')
+            return MatchCache({path: (version, song_id, status, score, bool(decided)) for path, version, song_id, status, score, decided in rows})
+        finally:
+            conn.close()
+    except sqlite3.DatabaseError: return MatchCache()
+
+@diagnostics.instrumented('match.tracks')
+def match_tracks(config, tracks, song_index=None):
+    # Fuzzy-matches tracks that are not in the song cache by path. Returns one (song, score, status) per track.
     MATCH_THRESHOLD = 75
     SUGGESTION_THRESHOLD = 10
+    # A fresh local index answers candidate searches offline; search3 is only used when it is stale or absent.
+    # Either way, candidates whose length is far from the track's #EXTINF duration are dropped before scoring.
+    if song_index is not None and not song_index.stale: search = lambda query, duration: song_index.search(query, duration=duration)
+    else: search = lambda query, duration: [song for song in search_tracks(config, query) if duration_matches(song, duration)]
+    with diagnostics.stage('match.normalize'):
+        queries = [[normalize_for_search(track['title']), normalize_for_search(track['album']), normalize_for_search(track['artist'])] for track in tracks]
+    with diagnostics.stage('match.search'): standard_results = [search(f"{track['artist']} {track['title']}", track.get('duration')) for track in tracks]
+    std_best = score_candidates(queries, standard_results)
+    title_pending = [i for i, (_, highest_std_score) in enumerate(std_best) if highest_std_score < MATCH_THRESHOLD]
+    with diagnostics.stage('match.search'): title_only_results = [search(tracks[i]['title'], tracks[i].get('duration')) for i in title_pending]
+    title_best = dict(zip(title_pending, score_candidates([queries[i] for i in title_pending], title_only_results, title_only=True)))
+    matches = []
+    for i, (best_std_candidate, highest_std_score) in enumerate(std_best):
+        best_title_candidate, highest_title_score = title_best.get(i, (None, 0))
+        final_match, final_score, status = None, 0, 'missing'
+        if highest_std_score >= MATCH_THRESHOLD:
+            final_match, final_score, status = best_std_candidate, highest_std_score, 'found'
+        elif highest_title_score > highest_std_score and highest_title_score >= SUGGESTION_THRESHOLD:
+            final_match, final_score, status = best_title_candidate, highest_title_score, 'suggestion'
+        elif highest_std_score >= SUGGESTION_THRESHOLD:
+            final_match, final_score, status = best_std_candidate, highest_std_score, 'suggestion'
+        matches.append((final_match, final_score, status))
+    return matches
+
+def _plan_check(local_tracks, song_cache, match_cache, cache_version, pending):
+    # Resolves tracks by path or from match_cache. Every other track gets a placeholder and its position
+    # is added to pending (normalized path -> [(results, index)]), so repeated paths are matched once.
     results = []
     for m3u_track in local_tracks:
-        final_match, final_score, status = None, 0, 'missing'
         normalized_path = m3u_track['path'].replace('\\', '/')
-        cached_match = song_cache.get(normalized_path)
-        if cached_match:
-            final_match, status, final_score = cached_match, 'ok', 100
+        cached_match, exact = find_cached_song(song_cache, normalized_path)
+        # Only an exact path skips the match cache; a user decision (Replace, Shift+Click) overrides a loose hit.
+        remembered = None
+        if not exact and match_cache is not None: remembered = match_cache.lookup(m3u_track, song_cache, cache_version, decided_only=bool(cached_match))
+        # A path that only matches loosely is reported as found, so that Save rewrites it to the server path.
+        if remembered is None and cached_match: results.append({'original_track': m3u_track, 'navidrome_song': cached_match, 'status': 'ok' if exact else 'found', 'score': 100})
         else:
-            search_query = f"{m3u_track['artist']} {m3u_track['title']}"
-            standard_results = search_tracks(config, search_query)
-            best_std_candidate, highest_std_score = None, 0
-            if standard_results:
-                norm_m3u_title = normalize_for_search(m3u_track['title'])
-                norm_m3u_album = normalize_for_search(m3u_track['album'])
-                norm_m3u_artist = normalize_for_search(m3u_track['artist'])
-                for song in standard_results:
-                    title_score = fuzz.ratio(norm_m3u_title, normalize_for_search(song.get('title', '')))
-                    album_score = fuzz.ratio(norm_m3u_album, normalize_for_search(song.get('album', '')))
-                    artist_score = fuzz.ratio(norm_m3u_artist, normalize_for_search(song.get('artist', '')))
-                    current_score = (title_score * 0.6) + (album_score * 0.3) + (artist_score * 0.1)
-                    if current_score > highest_std_score:
-                        highest_std_score, best_std_candidate = current_score, song
-            best_title_candidate, highest_title_score = None, 0
-            if highest_std_score < MATCH_THRESHOLD:
-                title_only_results = search_tracks(config, m3u_track['title'])
-                if title_only_results:
-                    norm_m3u_title = normalize_for_search(m3u_track['title'])
-                    for song in title_only_results:
-                        current_score = fuzz.ratio(norm_m3u_title, normalize_for_search(song.get('title', '')))
-                        if current_score > highest_title_score:
-                            highest_title_score, best_title_candidate = current_score, song
-            if highest_std_score >= MATCH_THRESHOLD:
-                final_match, final_score, status = best_std_candidate, highest_std_score, 'found'
-            elif highest_title_score > highest_std_score and highest_title_score >= SUGGESTION_THRESHOLD:
-                final_match, final_score, status = best_title_candidate, highest_title_score, 'suggestion'
-            elif highest_std_score >= SUGGESTION_THRESHOLD:
-                final_match, final_score, status = best_std_candidate, highest_std_score, 'suggestion'
-            else:
-                status = 'missing'
-        results.append({'original_track': m3u_track, 'navidrome_song': final_match, 'status': status, 'score': final_score})
-    return results
\ No newline at end of file
+            if remembered is None: pending.setdefault(normalized_path, []).append((results, len(results)))
+            results.append(remembered or {'original_track': m3u_track})
+    return results
+
+def _fan_out_matches(pending, paths, matches, match_cache, cache_version):
+    for path, (final_match, final_score, status) in zip(paths, matches):
+        for results, i in pending[path]:
+            results[i] = {'original_track': results[i]['original_track'], 'navidrome_song': final_match, 'status': status, 'score': final_score}
+        if match_cache is not None:
+            results, i = pending[path][0]
+            match_cache.remember(results[i], cache_version)
+
+def _representative_tracks(pending, paths):
+    return [pending[path][0][0][pending[path][0][1]]['original_track'] for path in paths]
+
+@diagnostics.instrumented('check.playlist')
+def run_playlist_check(config, local_tracks, song_cache, song_index=None, match_cache=None, cache_version=None):
+    # local_tracks may be any iterable, e.g. iter_m3u(); it is consumed once. Tracks already in
+    # match_cache are taken from there and every other path is matched once, however often it repeats.
+    pending = {}
+    results = _plan_check(local_tracks, song_cache, match_cache, cache_version, pending)
+    paths = list(pending)
+    _fan_out_matches(pending, paths, match_tracks(config, _representative_tracks(pending, paths), song_index), match_cache, cache_version)
+    return results
+
+@diagnostics.instrumented('check.collection')
+def check_collection(config, playlist_paths, song_cache, song_index=None, max_workers=None, cancel_event=None,
+                     match_cache=None, cache_version=None, progress_callback=None, chunk_size=50, playlist_callback=None):
+    # Checks many playlists as one job: every playlist is parsed first, each distinct unresolved track
+    # path is matched exactly once (chunks run in parallel) and the results are fanned back out.
+    # Returns ({playlist_path: results}, stats). Empty or unreadable playlists map to None. If
+    # cancel_event is set, playlists that still had unmatched tracks are left out. playlist_callback
+    # (path, results) is called, from this thread, as soon as each playlist's results are complete.
+    if max_workers is None: max_workers = config.get('check_workers', DEFAULT_CHECK_WORKERS)
+    stats = {'playlists': len(playlist_paths), 'tracks': 0, 'resolved': 0, 'unique_to_match': 0, 'matched': 0,
+             'searches_run': 0, 'searches_avoided': 0, 'cancelled': False}
+    pending, collection = {}, {}
+    owners, unmatched = {}, {}  # id(results) -> playlist path; playlist path -> tracks still to match
+    with ThreadPoolExecutor(max_workers=max(1, int(max_workers))) as executor:
+        for path, tracks in zip(playlist_paths, executor.map(load_playlist, playlist_paths)):
+            results = collection[path] = _plan_check(tracks, song_cache, match_cache, cache_version, pending) or None
+            stats['tracks'] += len(tracks)
+            unmatched[path] = sum(1 for item in results if 'status' not in item) if results else 0
+            if unmatched[path]: owners[id(results)] = path
+            elif playlist_callback: playlist_callback(path, results)
+        paths = list(pending)
+        stats['unique_to_match'] = len(paths)
+        stats['resolved'] = stats['tracks'] - sum(len(positions) for positions in pending.values())
+        if progress_callback: progress_callback(0, len(paths))
+        chunks = [paths[i:i + chunk_size] for i in range(0, len(paths), chunk_size)]
+        futures = {executor.submit(match_tracks, config, _representative_tracks(pending, chunk), song_index): chunk for chunk in chunks}
+        try:
+            for future in as_completed(futures):
+                if cancel_event is not None and cancel_event.is_set():
+                    stats['cancelled'] = True
+                    break
+                chunk, matches = futures[future], future.result()
+                _fan_out_matches(pending, chunk, matches, match_cache, cache_version)
+                for path in chunk:
+                    for results, _ in pending[path]:
+                        owner = owners[id(results)]
+                        unmatched[owner] -= 1
+                        if not unmatched[owner] and playlist_callback: playlist_callback(owner, results)
+                for path, (_, _, status) in zip(chunk, matches):
+                    # A track needs a second, title-only search unless the first one found it.
+                    searches = 1 if status == 'found' else 2
+                    stats['searches_run'] += searches
+                    stats['searches_avoided'] += searches * (len(pending[path]) - 1)
+                stats['matched'] += len(chunk)
+                if progress_callback: progress_callback(stats['matched'], len(paths))
+        finally:
+            for future in futures: future.cancel()
+    if stats['cancelled']:
+        collection = {path: results for path, results in collection.items() if results is None or all('status' in item for item in results)}
+    return collection, stats
+
+def accept_matches(results, min_score=0):
+    # Marks [FOUND] and [SUGGESTION] results scoring at least min_score as accepted, like Accept All.
+    # Returns the accepted items so the caller can remember them as decisions.
+    accepted = []
+    for item in results:
+        if item['status'] in ('found', 'suggestion') and item['navidrome_song'] and item['score'] >= min_score:
+            item['status'], item['score'] = 'ok', 100
+            accepted.append(item)
+    return accepted
+
+def validated_tracks(results):
+    # What Save writes: the server song of every OK or FOUND track, in playlist order.
+    return [item['navidrome_song'] for item in results if item['status'] in ('ok', 'found')]